@@ -455,11 +455,33 @@ class ChangeView(BaseView):
         quick_panel(items)
 
 
+    def has_partial_detail(self):
+        return '_partial_detail' in self.change
+
+    def has_many_revisions(self):
+        return len(self.change['revisions'].keys()) > 1 or self.get_current_rev()['_number'] > 1
+
+    def load_full_detail(self, callback):
+        def loaded(data):
+            if data is None or self.loading or self.destroying:
+                return
+
+            data[0]['current_revision'] = self.get_current_rev_id()
+            self.refresh(data)
+            callback()
+
+        if not self.loading:
+            self.resources.change(self.change['_number'], True).then(loaded)
+
     def display_switch_ps_menu(self):
         def switch_ps(change, revision_id):
             change[0]['current_revision'] = revision_id
             self.refresh(change)
 
+        if self.has_partial_detail():
+            self.load_full_detail(self.display_switch_ps_menu)
+            return
+
         items = []
 
         ordered = sort(self.change['revisions'], lambda a, b: self.change['revisions'][a]['_number'] - self.change['revisions'][b]['_number'])
@@ -471,7 +493,7 @@ class ChangeView(BaseView):
                 items.append({
                     'caption': ['Patch Set %d' % revision['_number']],
                     'rev': rev,
-                    'on_select': lambda item: self.resources.change(self.change['_number']).then(lambda data: switch_ps(data, item['rev']))
+                    'on_select': lambda item: self.resources.change(self.change['_number'], True).then(lambda data: switch_ps(data, item['rev']))
                 })
 
         quick_panel(items)
@@ -648,6 +670,10 @@ class ChangeView(BaseView):
 
 
     def reload(self):
+        # a review may have just been published, the diff view must not keep showing the old comments
+        if self.diff_view is not None:
+            self.diff_view.forget_published_comments()
+
         if self.loading:
             return
 
@@ -797,20 +823,21 @@ class ChangeView(BaseView):
         if self.diff_view is not None:
             self.diff_view.destroy()
 
-        ordered = sort(self.change['revisions'], lambda a, b:
-            self.change['revisions'][a]['_number'] - self.change['revisions'][b]['_number']
-        )
-
-        revisions = [self.change['revisions'][rev] for rev in ordered]
-
         self.diff_view = DiffView(
             self.view,
             self.change['_number'],
             self.get_current_rev(),
             filename,
-            revisions
+            self.get_ordered_revisions()
         )
 
+    def get_ordered_revisions(self):
+        ordered = sort(self.change['revisions'], lambda a, b:
+            self.change['revisions'][a]['_number'] - self.change['revisions'][b]['_number']
+        )
+
+        return [self.change['revisions'][rev] for rev in ordered]
+
     def edit_commit_message(self):
         current_rev = self.get_current_rev()
 
@@ -890,6 +917,7 @@ class ChangeView(BaseView):
             return
 
         self.destroying = True
+        self.resources.cancel_all()
 
         # forces all panels that could be left by the view to be closed
         ChangeView.window.get_output_panel('fake-close')
@@ -932,7 +960,7 @@ class ChangeView(BaseView):
         return self.display_changes_menu if len([f for f in cr['files'] if 'binary' not in cr['files'][f] or not cr['files'][f]['binary']]) > 0 else False
 
     def switch_patch_set_cmd(self):
-        return self.display_switch_ps_menu if len(self.change['revisions'].keys()) > 1 else False
+        return self.display_switch_ps_menu if self.has_many_revisions() else False
 
     def add_reviewer_cmd(self):
         return self.display_add_reviewer_menu if self.change['status'] not in ['ABANDONED', 'MERGED'] else False
@@ -991,7 +1019,7 @@ class ChangeView(BaseView):
             if re.match('^[a-zA-Z0-9]{40,}$', text):
                 if text in self.change['revisions']:
                     if not self.loading:
-                        self.resources.change(self.change['_number']).then(lambda data: switch_ps(data, text))
+                        self.resources.change(self.change['_number'], True).then(lambda data: switch_ps(data, text))
 
                     return
 
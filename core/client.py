@@ -21,18 +21,32 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 import sublime
 import urllib.request
 import urllib.error
+import http.client
+import threading
+import socket
 import base64
-
-#import zlib
+import time
+import io
+import copy
+import codecs
+import os
+import re
+from collections import OrderedDict
+
+try:
+    import zlib
+except ImportError:
+    zlib = None
 
 # from http.client import HTTPConnection
 # from urllib.request import HTTPHandler
 
-from .utils import error_message, log, version_compare
+from .utils import error_message, log, is_debug, summarize, version_compare
+from .disk_cache import DiskCache
 from .version import VERSION
-from .settings import ConnectionSettings
+from .settings import Settings, ConnectionSettings
 
-def create_https_handler():
+def create_https_connection_class():
     if sublime.platform() == 'linux':
         import ssl
         import socket
@@ -93,17 +107,304 @@ def create_https_handler():
                     self.sock.close()
                     raise
 
-        class HTTPSHandler(urllib.request.UnknownHandler):
-            def __init__(self, debuglevel=0, context=None, check_hostname=None):
-                self._context = context
-
-            def unknown_open(self, req):
-                return urllib.request.HTTPHandler().do_open(HTTPSConnection, req, context=self._context)
+        return HTTPSConnection
     else:
-        from urllib.request import HTTPSHandler
-        import ssl
+        from http.client import HTTPSConnection
+
+        return HTTPSConnection
+
+def create_ssl_context():
+    import ssl
+
+    return ssl.SSLContext(ssl.PROTOCOL_SSLv3)
+
+
+class ConnectionPool():
+    def __init__(self, size, idle_timeout):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.https_class = None
+        self.ssl_context = None
+
+    def configure(self, size, idle_timeout):
+        self.size = size
+        self.idle_timeout = idle_timeout
+
+    def create(self, key, host, timeout):
+        if key[0] == 'https':
+            if self.https_class is None:
+                self.https_class = create_https_connection_class()
+                self.ssl_context = create_ssl_context()
+
+            return self.https_class(host, timeout=timeout, context=self.ssl_context)
+
+        return http.client.HTTPConnection(host, timeout=timeout)
+
+    def get(self, key, host, timeout, reuse=True):
+        now = time.time()
+
+        if not reuse:
+            return self.create(key, host, timeout), False
+
+        with self.lock:
+            connections = self.idle.get(key, [])
+
+            while len(connections) > 0:
+                conn, released_at = connections.pop()
+
+                if now - released_at < self.idle_timeout and conn.sock is not None:
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+
+                    return conn, True
+
+                conn.close()
+
+        return self.create(key, host, timeout), False
+
+    def release(self, key, conn):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+
+            if conn.sock is not None and len(connections) < self.size:
+                connections.append((conn, time.time()))
+                return
+
+        conn.close()
+
+    def clear(self):
+        with self.lock:
+            for key in self.idle:
+                for conn, released_at in self.idle[key]:
+                    conn.close()
+
+            self.idle = {}
+
+
+class PooledResponse():
+    def __init__(self, response, url, on_release):
+        self.response = response
+        self.url = url
+        self.code = self.status = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+        self.on_release = on_release
+        self.buffer = None
+
+        # error bodies are small, read them at once so urllib auth and error
+        # handlers can reuse the connection for the retried request
+        if not 200 <= self.code < 300:
+            self.buffer = io.BytesIO(response.read())
+            self.release()
+
+    def read(self, amt=None):
+        if self.buffer is not None:
+            return self.buffer.read() if amt is None else self.buffer.read(amt)
+
+        if self.response is None:
+            return b''
+
+        data = self.response.read() if amt is None else self.response.read(amt)
+
+        if self.response.isclosed():
+            self.release()
+
+        return data
+
+    def release(self):
+        if self.on_release is not None:
+            self.on_release()
+            self.on_release = None
+
+    def close(self):
+        if self.on_release is not None:
+            self.on_release = None
+            self.response.close()
+            self.response = None
+
+    def info(self):
+        return self.headers
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def getcode(self):
+        return self.code
+
+    def geturl(self):
+        return self.url
+
+
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+
+# true only when the connection was closed before any byte of the response arrived
+def is_stale_connection_error(e):
+    if isinstance(e, getattr(http.client, 'RemoteDisconnected', ())):
+        return True
+
+    if isinstance(e, http.client.BadStatusLine):
+        return e.line in ['', "''"]
+
+    return isinstance(e, (ConnectionResetError, ConnectionAbortedError, BrokenPipeError))
+
+
+class KeepAliveHandler(urllib.request.HTTPHandler):
+    handler_order = 400
+
+    def __init__(self, pool):
+        urllib.request.HTTPHandler.__init__(self)
+        self.pool = pool
 
-    return HTTPSHandler(context=ssl.SSLContext(ssl.PROTOCOL_SSLv3))
+    def http_open(self, req):
+        return self.do_keepalive_open('http', req)
+
+    def https_open(self, req):
+        return self.do_keepalive_open('https', req)
+
+    https_request = urllib.request.AbstractHTTPHandler.do_request_
+
+    def do_keepalive_open(self, scheme, req):
+        host = req.host
+
+        if not host:
+            raise urllib.error.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items() if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((name.title(), val) for name, val in headers.items())
+
+        tunnel_headers = {}
+
+        if req._tunnel_host:
+            proxy_auth_hdr = 'Proxy-Authorization'
+
+            if proxy_auth_hdr in headers:
+                tunnel_headers[proxy_auth_hdr] = headers[proxy_auth_hdr]
+                del headers[proxy_auth_hdr]
+
+        key = (scheme, host, req._tunnel_host)
+        # a request that must not be sent twice gets a fresh connection, the server may have closed an idle one
+        reuse = req.get_method() in IDEMPOTENT_METHODS
+
+        while True:
+            conn, reused = self.pool.get(key, host, req.timeout, reuse)
+
+            if hasattr(req, 'on_connection') and not req.on_connection(conn):
+                raise urllib.error.URLError('request aborted')
+
+            if req._tunnel_host and not reused:
+                conn.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+
+            try:
+                conn.request(req.get_method(), req.selector, req.data, headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, socket.error) as e:
+                conn.close()
+
+                # server may have dropped an idle connection, retry until a fresh one is used
+                if reused and is_stale_connection_error(e):
+                    log('Pooled connection to %s lost (%s), reconnecting' % (host, e))
+                    continue
+
+                raise urllib.error.URLError(e)
+
+            break
+
+        def on_release():
+            if hasattr(req, 'on_release'):
+                req.on_release(conn)
+
+            if response.will_close:
+                conn.close()
+            else:
+                self.pool.release(key, conn)
+
+        return PooledResponse(response, req.get_full_url(), on_release)
+
+READ_CHUNK_SIZE = 65536
+
+XSSI_PREFIX = ")]}'"
+
+
+def iter_body(response):
+    encoding = (response.info().get('Content-Encoding') or '').strip().lower()
+    decompressor = None
+
+    if zlib is not None:
+        if encoding == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            decompressor = zlib.decompressobj()
+
+    first = True
+
+    while True:
+        chunk = response.read(READ_CHUNK_SIZE)
+
+        if not chunk:
+            break
+
+        if decompressor is not None:
+            try:
+                chunk = decompressor.decompress(chunk)
+            except zlib.error:
+                # some servers send raw deflate stream without zlib header
+                if not first or encoding != 'deflate':
+                    raise
+
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                chunk = decompressor.decompress(chunk)
+
+        first = False
+
+        yield chunk
+
+    if decompressor is not None:
+        yield decompressor.flush()
+
+
+def strip_xssi_prefix(text):
+    if text.startswith(XSSI_PREFIX):
+        return text[len(XSSI_PREFIX):].lstrip('\r\n')
+
+    return text
+
+
+def read_text(response, strip_xssi=False):
+    # decodes chunk by chunk, so the raw and the compressed body are never held in memory as a whole.
+    # this is not a streaming parse: the decoded text is still joined into one string for
+    # sublime.decode_value, which has no incremental API, so one full copy of the text remains
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pieces = []
+    head = ''
+
+    for chunk in iter_body(response):
+        text = decoder.decode(chunk)
+
+        if strip_xssi:
+            head += text
+
+            if len(head) <= len(XSSI_PREFIX) + 1:
+                continue
+
+            text = strip_xssi_prefix(head)
+            strip_xssi = False
+
+        pieces.append(text)
+
+    pieces.append(decoder.decode(b'', True))
+
+    if strip_xssi:
+        pieces.insert(0, strip_xssi_prefix(head))
+
+    text = ''.join(pieces)
+    del pieces[:]
+
+    return text
 
 # class HTTP10Connection(HTTPConnection):
 #     _http_vsn = 10
@@ -126,24 +427,278 @@ class Fixed_HTTPPasswordMgrWithDefaultRealm(urllib.request.HTTPPasswordMgrWithDe
         return True
 
 
+class AuthState():
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self.scheme = None
+        self.digest_challenge = None
+        self.lock = threading.Lock()
+
+
 class Spied_HTTPBasicAuthHandler(urllib.request.HTTPBasicAuthHandler):
-    def retry_http_basic_auth(*args):
+    def __init__(self, password_mgr, auth_state):
+        urllib.request.HTTPBasicAuthHandler.__init__(self, password_mgr)
+        self.auth_state = auth_state
+
+    def retry_http_basic_auth(self, host, req, realm):
         log('Using Basic Auth')
+        GerritClient.auth_stats['challenges'] += 1
+        self.auth_state.scheme = 'basic'
 
-        return urllib.request.HTTPBasicAuthHandler.retry_http_basic_auth(*args)
+        return urllib.request.HTTPBasicAuthHandler.retry_http_basic_auth(self, host, req, realm)
 
 
 class Spied_HTTPDigestAuthHandler(urllib.request.HTTPDigestAuthHandler):
-    def retry_http_digest_auth(*args):
+    def __init__(self, password_mgr, auth_state):
+        urllib.request.HTTPDigestAuthHandler.__init__(self, password_mgr)
+        self.auth_state = auth_state
+
+    def retry_http_digest_auth(self, req, auth):
         log('Using Digest Auth')
-        return urllib.request.HTTPDigestAuthHandler.retry_http_digest_auth(*args)
+        GerritClient.auth_stats['challenges'] += 1
+
+        token, challenge = auth.split(' ', 1)
+
+        with self.auth_state.lock:
+            self.auth_state.scheme = 'digest'
+            self.auth_state.digest_challenge = urllib.request.parse_keqv_list(
+                filter(None, urllib.request.parse_http_list(challenge))
+            )
+
+        return urllib.request.HTTPDigestAuthHandler.retry_http_digest_auth(self, req, auth)
+
+
+class PreemptiveAuthHandler(urllib.request.BaseHandler):
+    handler_order = 400
+
+    def __init__(self, auth_state, digest_handler):
+        self.auth_state = auth_state
+        self.digest_handler = digest_handler
+
+    def http_request(self, req):
+        state = self.auth_state
+
+        if state.scheme == 'basic':
+            raw = '%s:%s' % (state.username, state.password)
+            req.add_unredirected_header('Authorization', 'Basic ' + base64.b64encode(raw.encode()).decode('ascii'))
+
+        elif state.scheme == 'digest':
+            # reuses the last nonce, the server answers with a fresh challenge when it went stale
+            with state.lock:
+                auth = self.digest_handler.get_authorization(req, state.digest_challenge)
+
+            if auth:
+                req.add_unredirected_header('Authorization', 'Digest %s' % auth)
+
+        return req
+
+    https_request = http_request
+
+
+class ResponseCache():
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0}
+
+    def configure(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+            return entry
+
+    def put(self, key, etag, content_type, data):
+        # data is decoded text, the limit is in bytes
+        size = len(data.encode('utf-8')) if etag else 0
+
+        with self.lock:
+            self.remove(key)
+
+            if not etag or size > self.max_bytes:
+                return
+
+            self.entries.update({key: {'etag': etag, 'content_type': content_type, 'data': data, 'size': size}})
+            self.size += size
+            self.evict()
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= entry['size']
+
+    def evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 0:
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry['size']
+
+    def hit(self, entry):
+        self.stats['hits'] += 1
+        self.stats['bytes_saved'] += entry.get('size', 0)
+        self.log()
+
+    def miss(self):
+        self.stats['misses'] += 1
+        self.log()
+
+    def log(self):
+        if not is_debug():
+            return
+
+        log('Response cache: %d hits, %d misses, %d bytes saved, %d entries, %d bytes' % (
+            self.stats['hits'],
+            self.stats['misses'],
+            self.stats['bytes_saved'],
+            len(self.entries),
+            self.size
+        ))
+
+
+# a revision addressed by its commit SHA never changes
+IMMUTABLE_PATH = re.compile('^/changes/[^/]+/revisions/[0-9a-f]{40}/files/[^/]+/(diff|content)([?]|$)')
+PERSISTENT_PATH = re.compile('^/changes/[^/]+/detail([?]|$)')
+
+
+class InFlightRequest():
+    def __init__(self):
+        self.waiters = []
+        self.result = None
+        self.aborted = False
 
 
 class GerritClient():
+    pool = None
+    openers = {}
+    cache = None
+    disk_cache = None
+    auth_stats = {'requests': 0, 'challenges': 0}
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+
+    @classmethod
+    def get_pool(self):
+        size = int(Settings.get('connection.pool_size') or 4)
+        idle_timeout = int(Settings.get('connection.pool_idle_timeout') or 60)
+
+        if GerritClient.pool is None:
+            GerritClient.pool = ConnectionPool(size, idle_timeout)
+        else:
+            GerritClient.pool.configure(size, idle_timeout)
+
+        return GerritClient.pool
+
+    @classmethod
+    def get_cache(self):
+        max_bytes = int(float(Settings.get('cache.memory_size') or 0) * 1024 * 1024)
+
+        if max_bytes <= 0:
+            GerritClient.cache = None
+        elif GerritClient.cache is None:
+            GerritClient.cache = ResponseCache(max_bytes)
+        else:
+            GerritClient.cache.configure(max_bytes)
+
+        return GerritClient.cache
+
+    @classmethod
+    def get_disk_cache(self):
+        max_bytes = int(float(Settings.get('cache.disk_size') or 0) * 1024 * 1024)
+
+        if max_bytes <= 0 or zlib is None:
+            GerritClient.disk_cache = None
+        elif GerritClient.disk_cache is None:
+            GerritClient.disk_cache = DiskCache(os.path.join(sublime.cache_path(), 'SublimeGerrit'), max_bytes)
+        else:
+            GerritClient.disk_cache.configure(max_bytes)
+
+        return GerritClient.disk_cache
+
     def __init__(self, connection):
         self.connection = connection
         self.silent = False
         self.ssl_checked = False
+        self.aborted = False
+        self.active_conn = None
+        self.conn_lock = threading.Lock()
+        self.waiting = None
+
+    def get_opener(self, auth):
+        pool = self.get_pool()
+        key = (self.connection['username'], self.connection['password']) if auth else None
+
+        if key not in GerritClient.openers:
+            if auth:
+                password_mgr = Fixed_HTTPPasswordMgrWithDefaultRealm()
+                password_mgr.add_password(self.connection['username'], self.connection['password'])
+                auth_state = AuthState(self.connection['username'], self.connection['password'])
+            else:
+                password_mgr = None
+                auth_state = AuthState(None, None)
+
+            digest_handler = Spied_HTTPDigestAuthHandler(password_mgr, auth_state)
+
+            handlers = [
+                KeepAliveHandler(pool),
+                PreemptiveAuthHandler(auth_state, digest_handler),
+                digest_handler,
+                Spied_HTTPBasicAuthHandler(password_mgr, auth_state),
+                urllib.request.ProxyDigestAuthHandler(password_mgr),
+                urllib.request.ProxyBasicAuthHandler(password_mgr)
+            ]
+
+            GerritClient.openers.update({key: urllib.request.build_opener(*handlers)})
+
+        return GerritClient.openers[key]
+
+    def set_active_connection(self, conn):
+        with self.conn_lock:
+            self.active_conn = conn
+
+        if self.aborted:
+            self.abort()
+
+        return not self.aborted
+
+    # called before the connection goes back to the pool, another request may use it afterwards
+    def release_active_connection(self, conn=None):
+        with self.conn_lock:
+            if conn is None or self.active_conn is conn:
+                self.active_conn = None
+
+    def abort(self):
+        self.aborted = True
+        waiting = self.waiting
+
+        if waiting is not None:
+            waiting.set()
+
+        with self.conn_lock:
+            conn = self.active_conn
+
+            if conn is None:
+                return
+
+            log('Aborting request')
+
+            # shutdown wakes up the worker blocked on reading the socket
+            try:
+                if conn.sock is not None:
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+            conn.close()
 
     def request(self, method, path, body=None, silent=False):
         url = self.connection['url'] if 'url' in self.connection else ConnectionSettings.get_url()
@@ -156,76 +711,163 @@ class GerritClient():
         else:
             url += path
 
-        if auth:
-            password_mgr = Fixed_HTTPPasswordMgrWithDefaultRealm()
-            password_mgr.add_password(self.connection['username'], self.connection['password'])
-        else:
-            password_mgr = None
+        if method != 'GET' or body is not None:
+            return self.send(method, url, path, auth, body, silent)
+
+        key = (url, self.connection.get('username'), self.connection.get('password'), silent)
+
+        with GerritClient.in_flight_lock:
+            flight = GerritClient.in_flight.get(key)
+
+            if flight is None:
+                flight = InFlightRequest()
+                GerritClient.in_flight.update({key: flight})
+                leader = True
+            else:
+                self.waiting = threading.Event()
+                flight.waiters.append(self.waiting)
+                leader = False
+
+        if not leader:
+            return self.join(flight, method, url, path, auth, silent)
+
+        result = None
+
+        try:
+            result = self.send(method, url, path, auth, None, silent)
+        finally:
+            with GerritClient.in_flight_lock:
+                del GerritClient.in_flight[key]
+
+                # callers may modify what they get, so waiters receive their own copy
+                flight.result = copy.deepcopy(result) if flight.waiters else None
+                flight.aborted = self.aborted
+
+            for waiter in flight.waiters:
+                waiter.set()
 
-        handlers = [
-            create_https_handler(),
-            Spied_HTTPDigestAuthHandler(password_mgr),
-            Spied_HTTPBasicAuthHandler(password_mgr),
-            urllib.request.ProxyDigestAuthHandler(password_mgr),
-            urllib.request.ProxyBasicAuthHandler(password_mgr)
-        ]
+        return result
 
-        opener = urllib.request.build_opener(*handlers)
-        s = '%s:%s' % (self.connection['username'], self.connection['password'])
+    def join(self, flight, method, url, path, auth, silent):
+        log('Joining in-flight request', method, url)
+
+        if not self.aborted:
+            self.waiting.wait()
+
+        self.waiting = None
+
+        if self.aborted:
+            return None
+
+        if flight.aborted:
+            log('In-flight request aborted, sending own request', method, url)
+            return self.send(method, url, path, auth, None, silent)
+
+        return copy.deepcopy(flight.result)
+
+    def send(self, method, url, path, auth, body, silent):
+        opener = self.get_opener(auth)
+        GerritClient.auth_stats['requests'] += 1
 
         headers = {
             'User-Agent': 'SublimeGerrit/' + VERSION
         }
 
+        if zlib is not None and Settings.get('connection.compression'):
+            headers.update({'Accept-Encoding': 'gzip, deflate'})
+
         if isinstance(body, dict):
             headers.update({'Content-Type': 'application/json;charset=UTF-8'})
             body = sublime.encode_value(body, False).encode('utf-8')
 
+        cache = self.get_cache() if method == 'GET' else None
+        cache_key = (url, self.connection.get('username'))
+        cached = cache.get(cache_key) if cache is not None else None
+
+        immutable = method == 'GET' and IMMUTABLE_PATH.match(path) is not None
+        disk_cache = self.get_disk_cache() if immutable or (method == 'GET' and PERSISTENT_PATH.match(path)) else None
+
+        if cached is None and disk_cache is not None:
+            cached = disk_cache.get(cache_key)
+
+            if cached is not None and cache is not None:
+                cache.put(cache_key, cached['etag'], cached['content_type'], cached['data'])
+
+        if cached is not None and immutable:
+            log('RESPONSE served from cache', url)
+
+            return self.decode(cached['data'], cached['content_type'])
+
+        if cached is not None and cached['etag']:
+            headers.update({'If-None-Match': cached['etag']})
+
         request = urllib.request.Request(url, data=body, headers=headers)
         request.get_method = lambda: method
+        request.on_connection = self.set_active_connection
+        request.on_release = self.release_active_connection
+
+        if is_debug():
+            log('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>')
+            log('REQUEST', method, url)
+            for header in request.header_items():
+                log('%s:%s' % header)
+            log('')
+            log(summarize(body))
 
-        log('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>')
-        log('REQUEST', method, url)
-        for header in request.header_items():
-            log('%s:%s' % header)
-        log('')
-        log(body)
+        if self.aborted:
+            return None
 
         try:
             f = opener.open(request, timeout=int(self.connection['timeout']))
-            data = f.read()
-            # data = zlib.decompress(f.read(), 16+zlib.MAX_WBITS)
+            content_type = f.info().get('Content-Type') or ''
+            data = read_text(f, not content_type.startswith('text/plain'))
 
             f.close()
 
-            log('<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
-            log('RESPONSE', f.getcode())
-            for header in f.getheaders():
-                log('%s: %s' % header)
-            log('')
-            log(data)
-            log('=====================================')
+            if self.aborted:
+                return None
+
+            if is_debug():
+                log('<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
+                log('RESPONSE', f.getcode())
+                for header in f.getheaders():
+                    log('%s: %s' % header)
+                log('')
+                log(summarize(data))
+                log('Auth challenges: %d of %d requests' % (GerritClient.auth_stats['challenges'], GerritClient.auth_stats['requests']))
+                log('=====================================')
+
+            etag = f.info().get('ETag')
 
-            for header in f.getheaders():
-                name, value = header
+            if cache is not None:
+                cache.put(cache_key, etag, content_type, data)
+                cache.miss()
 
-                if name == 'Content-Type' and value.startswith('text/plain'):
-                    return data.decode('utf-8')
+            if disk_cache is not None and (immutable or etag):
+                disk_cache.put(cache_key, etag, content_type, data)
 
-            return sublime.decode_value(data[5:].decode('utf-8'))
+            return self.decode(data, content_type)
         except urllib.error.HTTPError as e:
+            if e.code == 304 and cached is not None and not self.aborted:
+                log('RESPONSE 304, served from cache')
+
+                if cache is not None:
+                    cache.hit(cached)
+
+                return self.decode(cached['data'], cached['content_type'])
+
             log('urllib.error.HTTPError', e)
 
-            if not silent:
+            if not silent and not self.aborted:
                 if e.code in [400, 409]:
-                    error_message(e.read().decode('utf-8').strip())
+                    error_message(read_text(e).strip())
                 else:
                     error_message(str(e))
 
         except urllib.error.URLError as e:
             log('urllib.error.URLError', e)
 
-            if not silent:
+            if not silent and not self.aborted:
                 reason = str(e.reason)
 
                 if reason.startswith('[SSL:'):
@@ -236,7 +878,16 @@ class GerritClient():
         except Exception as e:
             log('urllib.error.*', e)
 
-            if not silent:
+            if not silent and not self.aborted:
                 error_message(str(e))
 
+        finally:
+            self.release_active_connection()
+
         return None
+
+    def decode(self, data, content_type):
+        if content_type.startswith('text/plain'):
+            return data
+
+        return sublime.decode_value(data)
@@ -26,6 +26,7 @@ from urllib.parse import urlencode
 
 from .client import GerritClient
 from .resources import GerritResources
+from .executor import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH
 from .utils import get_labels, error_message, info_message, quick_panel, quick_menu, project_query, git_root, mkdate
 from .template import Template
 from .settings import Settings, ProjectSettings, ConnectionSettings
@@ -101,32 +102,55 @@ class SublimeGerritMenuCommand(sublime_plugin.WindowCommand):
 class SublimeGerritDashboardCommand(_EditorCommand):
     def run(self, query='status:open', limit=25):
         query += project_query()
+        loaded = []
+        template = Template('dashboard_item')
 
-        def display_menu(changes):
+        def fetch_page(start):
+            params = {'q': query}
+
+            if start > 0:
+                params.update({'S': start})
+
+            return resources.changes(limit, params)
+
+        def display_menu(changes, selected_index=-1):
             if changes is None:
                 return
 
-            if len(changes) > 0:
-                items = []
+            for change in changes:
+                change.update({
+                    'updated': mkdate(change['updated']),
+                    'created': mkdate(change['created'])
+                })
 
-                template = Template('dashboard_item')
+                loaded.append({
+                    'caption': template.apply(change) + get_labels(change),
+                    'change': change
+                })
 
-                for change in changes:
-                    change.update({
-                        'updated': mkdate(change['updated']),
-                        'created': mkdate(change['created'])
-                    })
+            if len(loaded) > 0:
+                items = loaded[:]
+
+                if len(changes) > 0 and changes[-1]['_more_changes'] is True:
+                    # next page is fetched while the user looks at this one
+                    next_page = fetch_page(len(loaded)).set_priority(PRIORITY_PREFETCH).start()
 
                     items.append({
-                        'caption': template.apply(change) + get_labels(change),
-                        'change': change
+                        'caption': ['Load more...'],
+                        'on_select': lambda item: next_page.set_priority(PRIORITY_INTERACTIVE).then(
+                            lambda changes: display_menu(changes, len(items) - 1)
+                        )
                     })
 
-                quick_panel(items, lambda selected_item: self.load_change(selected_item['change']))
+                quick_panel(items, self.on_select, selected_index=selected_index)
             else:
                 error_message('There are no items to display')
 
-        resources.changes(limit, {'q': query}).then(display_menu)
+        fetch_page(0).then(display_menu)
+
+    def on_select(self, item):
+        if 'change' in item:
+            self.load_change(item['change'])
 
     def load_change(self, change):
         def display_change(change):
@@ -155,7 +179,7 @@ class SublimeGerritSearchCommand(_EditorCommand):
     def search(self, text):
         self.window.run_command('sublime_gerrit_dashboard', {
             'query': text,
-            'limit': 100
+            'limit': 25
         })
 
 
@@ -19,16 +19,108 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 """
 
 import sublime
+import threading
+from bisect import bisect_left, bisect_right, insort
 from time import sleep
 
 from .resources import GerritResources
-from .utils import mkdate, sort_num, quick_panel, is_in_viewport, get_reviewer_name, ellipsis
+from .utils import mkdate, sort_num, quick_panel, is_in_viewport, get_reviewer_name, ellipsis, log, is_debug
 from .settings import Settings
 
+
+class CommentRenderer():
+    DEBOUNCE = 10
+    REGION_NAME_PATTERN = '1-comments-%s-%s'
+
+    def __init__(self, view):
+        self.view = view
+        self.lock = threading.Lock()
+        self.lines = {}
+        self.painted_keys = set()
+        self.pending = False
+        self.destroyed = False
+        self.stats = {'changes': 0, 'callbacks': 0, 'paints': 0}
+
+    # one icon per view line, the last comment drawn at a line wins
+    def set(self, view_line, icon, active, region):
+        with self.lock:
+            self.lines.update({view_line: (icon, active, region)})
+
+        self.schedule()
+
+    def erase(self, view_line):
+        with self.lock:
+            self.lines.pop(view_line, None)
+
+        self.schedule()
+
+    def schedule(self):
+        with self.lock:
+            self.stats['changes'] += 1
+
+            if self.pending or self.destroyed:
+                return
+
+            self.pending = True
+            self.stats['callbacks'] += 1
+
+        sublime.set_timeout(self.paint, self.DEBOUNCE)
+
+    def paint(self):
+        with self.lock:
+            self.pending = False
+
+            if self.destroyed:
+                return
+
+            groups = {}
+
+            for icon, active, region in self.lines.values():
+                groups.setdefault((icon, active), []).append(region)
+
+            lines = len(self.lines)
+            self.stats['paints'] += 1
+
+        keys = set()
+
+        for icon, active in groups:
+            key = self.REGION_NAME_PATTERN % (icon.split('.')[0], 'active' if active else 'inactive')
+            keys.add(key)
+
+            self.view.add_regions(
+                key,
+                groups[(icon, active)],
+                Settings.get('diff.comment_icon_active' if active else 'diff.comment_icon_inactive'),
+                Comment.ICON_PATH + icon,
+                sublime.HIDDEN
+            )
+
+        for key in self.painted_keys - keys:
+            self.view.erase_regions(key)
+
+        self.painted_keys = keys
+
+        if is_debug():
+            log('Comment icons: %d lines, %d changes, %d UI callbacks, %d paints' % (
+                lines,
+                self.stats['changes'],
+                self.stats['callbacks'],
+                self.stats['paints']
+            ))
+
+    def destroy(self):
+        with self.lock:
+            self.destroyed = True
+            self.lines = {}
+
+        for key in self.painted_keys:
+            self.view.erase_regions(key)
+
+        self.painted_keys = set()
+
 class Comment():
     ICON = 'comment.png'
     ICON_PATH = 'Packages/SublimeGerrit/icons/'
-    REGION_NAME_PATTERN = '1-comment-%d-icon'
 
     def __init__(self, comment, collection):
         self.id = comment['id']
@@ -42,7 +134,7 @@ class Comment():
         self.updated = mkdate(comment['updated'])
         self.author = comment['author'] if 'author' in comment else None
         self.region = None
-        self.region_name = None
+        self.view_line = None
         self.collection = collection
         self.destroyed = False
         self.editing = False
@@ -51,34 +143,20 @@ class Comment():
 
     def destroy(self):
         self.destroyed = True
-        self.collection.view.erase_regions(self.region_name)
+
+        if self.view_line is not None:
+            self.collection.renderer.erase(self.view_line)
 
     def draw(self, active=False):
         if self.destroyed:
             return
 
-        view_line = self.collection.real_to_view[self.line]
-
         if self.region is None:
-            point = self.collection.view.text_point(view_line, 0)
+            self.view_line = self.collection.real_to_view[self.line]
+            point = self.collection.view.text_point(self.view_line, 0)
             self.region = self.collection.view.line(sublime.Region(point, point))
-            self.region_name = self.REGION_NAME_PATTERN % view_line
 
-        def draw():
-            if self.destroyed: # when destroyed during timeouts, clear region and dont draw
-                self.destroy()
-                return
-
-            self.collection.view.add_regions(
-                self.region_name,
-                [self.region],
-                Settings.get('diff.comment_icon_inactive' if not active else 'diff.comment_icon_active'),
-                self.ICON_PATH + self.ICON,
-                sublime.HIDDEN
-            )
-
-        for i in range(0, 7): # redraw a few times to make sure it will be painted... damn st gutter issue
-            sublime.set_timeout(lambda: draw(), 10 * i)
+        self.collection.renderer.set(self.view_line, self.ICON, active, self.region)
 
 
     def update_message(self, message, in_reply_to = None):
@@ -106,7 +184,8 @@ class Comment():
             ).then(update_message)
 
     def hide(self):
-        self.collection.view.erase_regions(self.region_name)
+        if self.view_line is not None:
+            self.collection.renderer.erase(self.view_line)
 
     def show(self):
         self.draw()
@@ -136,7 +215,6 @@ class Comment():
 
 class DraftComment(Comment):
     ICON = 'draft.png'
-    REGION_NAME_PATTERN = '1-comment-%d-icon'
 
     def destroy(self):
         line = self.get_line()
@@ -148,7 +226,7 @@ class DraftComment(Comment):
             comments[line][0].draw()
 
 class CommentsStore():
-    def __init__(self, view_parent, view_revision, lines_parent, lines_revision, file_name, change_id, revision_id, base, load_callback=None):
+    def __init__(self, view_parent, view_revision, lines_parent, lines_revision, file_name, change_id, revision_id, base, load_callback=None, comments_loader=None):
         self.change_id = change_id
         self.revision_id = revision_id
         self.base = base
@@ -157,6 +235,8 @@ class CommentsStore():
         self.loaded_comments = False
         self.loaded_drafts = False
         self.load_callback = load_callback
+        self.comments_loader = comments_loader
+        self.destroyed = False
         self.count_by_file = {}
 
         self.sides = {
@@ -167,12 +247,21 @@ class CommentsStore():
         self.load()
 
     def destroy(self):
+        self.destroyed = True
+        self.resources.cancel_all()
         self.sides['PARENT'].destroy()
         self.sides['REVISION'].destroy()
 
+    # published comments may come from a request shared by all files of the revision
+    def request_comments(self, revision_id):
+        if self.comments_loader is not None:
+            return self.comments_loader(revision_id)
+
+        return self.resources.get_comments(self.change_id, revision_id)
+
     def load(self):
         if self.base is None:
-            self.resources.get_comments(self.change_id, self.revision_id).then(self.on_load_comments)
+            self.request_comments(self.revision_id).then(self.on_load_comments)
             self.resources.get_draft_comments(self.change_id, self.revision_id).then(self.on_load_drafts)
         else:
             self.sides['PARENT'].load(self.base, self.revision_id, load_callback=lambda collection: self.load_callback is not None and self.load_callback(self))
@@ -226,6 +315,9 @@ class CommentsStore():
         self.on_load_complete()
 
     def on_load_complete(self):
+        if self.destroyed:
+            return
+
         if self.loaded_comments is not False and self.loaded_drafts is not False:
             data = self.loaded_comments
 
@@ -303,6 +395,8 @@ class CommentsCollection():
         self.revision_id = None
         self.comments = {}
         self.drafts = {}
+        self.comment_lines = []
+        self.draft_lines = []
         self.resources = GerritResources()
         self.real_to_view, self.view_to_real = lines
         self.file_name = file_name
@@ -315,8 +409,14 @@ class CommentsCollection():
         self.add_draft_callback = None
         self.remove_draft_callback = None
         self.store = store
+        self.renderer = CommentRenderer(view)
+        self.destroyed = False
 
     def destroy(self):
+        self.destroyed = True
+        self.resources.cancel_all()
+        self.renderer.destroy()
+
         for line in self.comments:
             for comment in self.comments[line]:
                 comment.destroy()
@@ -327,6 +427,8 @@ class CommentsCollection():
 
         self.comments = {}
         self.drafts = {}
+        self.comment_lines = []
+        self.draft_lines = []
 
         self.load_callback = None
         self.add_draft_callback = None
@@ -338,7 +440,7 @@ class CommentsCollection():
         self.load_callback = load_callback
 
         if alternate_revision_id is None:
-            self.resources.get_comments(self.change_id, revision_id).then(self.on_load_comments)
+            self.store.request_comments(revision_id).then(self.on_load_comments)
             self.resources.get_draft_comments(self.change_id, revision_id).then(self.on_load_drafts)
 
         else:
@@ -351,6 +453,8 @@ class CommentsCollection():
                         for comment in data[file_name]:
                             if 'side' not in comment or comment['side'] in ['REVISION', '']:
                                 if switch_side:
+                                    # the response may be shared, leave it untouched
+                                    comment = dict(comment)
                                     comment.update({'side': 'PARENT'})
 
                                 if file_name not in target_data[target]:
@@ -364,8 +468,7 @@ class CommentsCollection():
                     on_load(target_data[target])
 
 
-            self.resources.get_comments(
-                self.change_id,
+            self.store.request_comments(
                 revision_id
             ).then(
                 lambda data: loaded(
@@ -376,8 +479,7 @@ class CommentsCollection():
                 )
             )
 
-            self.resources.get_comments(
-                self.change_id,
+            self.store.request_comments(
                 alternate_revision_id
             ).then(
                 lambda data: loaded(
@@ -435,6 +537,7 @@ class CommentsCollection():
             self.comments.update({
                 comment.get_line(): [comment]
             })
+            insort(self.comment_lines, comment.get_line())
         else:
             self.comments[comment.get_line()].append(comment)
 
@@ -459,6 +562,7 @@ class CommentsCollection():
             self.drafts.update({
                 comment.get_line(): [comment]
             })
+            insort(self.draft_lines, comment.get_line())
         else:
             self.drafts[comment.get_line()].append(comment)
 
@@ -474,6 +578,9 @@ class CommentsCollection():
         self.on_load_complete()
 
     def on_load_complete(self):
+        if self.destroyed:
+            return
+
         if self.loaded_comments is not False and self.loaded_drafts is not False:
             data = self.loaded_comments
 
@@ -542,9 +649,56 @@ class CommentsCollection():
             self.drafts[line].remove(comment)
             if len(self.drafts[line]) == 0:
                 del self.drafts[line]
+                del self.draft_lines[bisect_left(self.draft_lines, line)]
 
         comment.destroy()
 
+    # in the order the browser lists them, drafts first
+    def get_comments_at_line(self, real_line):
+        return self.drafts.get(real_line, []) + self.comments.get(real_line, [])
+
+    def get_neighbour_line(self, real_line, direction):
+        candidates = []
+
+        for lines in [self.draft_lines, self.comment_lines]:
+            if direction == 1:
+                index = bisect_right(lines, real_line)
+
+                if index < len(lines):
+                    candidates.append(lines[index])
+            else:
+                index = bisect_left(lines, real_line)
+
+                if index > 0:
+                    candidates.append(lines[index - 1])
+
+        if len(candidates) == 0:
+            return None
+
+        return min(candidates) if direction == 1 else max(candidates)
+
+    def get_next_comment(self, comment, direction):
+        comments = self.get_comments_at_line(comment.get_line()) if comment is not None else []
+
+        if comment in comments:
+            index = comments.index(comment) + direction
+
+            if index >= 0 and index < len(comments):
+                return comments[index]
+
+            line = self.get_neighbour_line(comment.get_line(), direction)
+
+            if line is None:
+                return None
+
+            comments = self.get_comments_at_line(line)
+
+            return comments[0] if direction == 1 else comments[-1]
+
+        line = self.get_neighbour_line(0, 1)
+
+        return self.get_comments_at_line(line)[0] if line is not None else None
+
     def get_draft_at_line(self, real_line):
         drafts = self.get_drafts(real_line=real_line)
 
@@ -622,19 +776,22 @@ class CommentsBrowser():
 
         collection = self.store.get_collection_by_view(self.view)
 
+        real_lines = []
+
+        # a comment inside a fold maps to the fold's marker row, which has no real line of its own
         if isinstance(edited_comment, DraftComment):
             sublime.set_timeout(lambda: self.activate_comment(edited_comment), 100)
             self.view_lines = [collection.real_to_view[edited_comment.get_line()]]
+            real_lines.append('%d' % edited_comment.get_line())
         elif isinstance(edited_comment, Comment):
             self.view_lines = [collection.real_to_view[edited_comment.get_line()]]
+            real_lines.append('%d' % edited_comment.get_line())
             edited_comment = None
         else:
             edited_comment = None
 
-        real_lines = []
-
-        for line in self.view_lines:
-            real_lines.append('%d' % collection.view_to_real[line])
+            for line in self.view_lines:
+                real_lines.append('%d' % collection.view_to_real[line])
 
         caption = '%s: Comment line%s %s' % (
             'Left' if collection.side == 'PARENT' else 'Right',
@@ -792,27 +949,12 @@ class CommentsBrowser():
 
     def activate_next_comment(self, direction):
         active_comment = CommentsBrowser.last_active_comment
+        collection = self.store.get_collection_by_view(self.view)
 
-        comments = self.prepare(True, True, False)
-
-        if comments is None or len(comments) == 0:
+        if collection is None:
             return False
 
-        next_comment = None
-
-        if active_comment:
-            try:
-                index = comments.index(active_comment)
-
-                if direction == 1 and index < len(comments) - 1:
-                    next_comment = comments[index + 1]
-                elif direction == -1 and index > 0:
-                    next_comment = comments[index - 1]
-            except ValueError:
-                next_comment = comments[0]
-
-        else:
-            next_comment = comments[0]
+        next_comment = collection.get_next_comment(active_comment, direction)
 
         if next_comment is not None:
             if active_comment:
@@ -822,30 +964,12 @@ class CommentsBrowser():
 
 
     def has_next_comment(self, direction):
-        active_comment = CommentsBrowser.last_active_comment
-
-        comments = self.prepare(True, True, False)
+        collection = self.store.get_collection_by_view(self.view)
 
-        if comments is None or len(comments) == 0:
+        if collection is None:
             return False
 
-        next_comment = None
-
-        if active_comment:
-            try:
-                index = comments.index(active_comment)
-
-                if direction == 1 and index < len(comments) - 1:
-                    next_comment = comments[index + 1]
-                elif direction == -1 and index > 0:
-                    next_comment = comments[index - 1]
-            except ValueError:
-                next_comment = comments[0]
-
-        else:
-            next_comment = comments[0]
-
-        return next_comment is not None
+        return collection.get_next_comment(CommentsBrowser.last_active_comment, direction) is not None
 
 
     def prepare(self, comments = True, drafts = True, cancel = True):
@@ -0,0 +1,195 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+
+from .line_mapping import LineMapping
+
+
+def get_intralines(diff, edit, change):
+    result = []
+    last_edit = 0
+
+    if diff['intraline_status'] == 'OK':
+        for intra in change[edit]:
+            begin = last_edit + intra[0]
+            end = begin + intra[1]
+            last_edit = end
+
+            result.append([begin, end])
+
+    return result
+
+
+def get_hidden_range(index, count, length, line_a, fold_context, expanded_folds):
+    begin = fold_context if index > 0 else 0
+    end = length - fold_context if index < count - 1 else length
+
+    if end - begin < max(fold_context, 1):
+        return None
+
+    for first, last in expanded_folds:
+        if first <= line_a + end and last > line_a + begin:
+            return None
+
+    return (begin, end)
+
+
+def render_side(items):
+    content = []
+    blocks = []
+    intralines = []
+    folds = []
+    size = 0
+
+    for index in range(len(items)):
+        item = items[index]
+        begin = size
+
+        if len(item['lines']) == 0:
+            continue
+
+        content += item['lines']
+        size += sum([len(line) + 1 for line in item['lines']])
+
+        if item['type'] in ['change', 'missing']:
+            line_starts = []
+            ends = begin
+
+            for line in item['lines']:
+                line_starts.append(ends)
+                ends += len(line) + 1
+
+            blocks.append({
+                'index': index,
+                'type': item['type'],
+                'begin': begin,
+                'end': size,
+                'removal': item.get('removal', False),
+                'line_starts': line_starts
+            })
+
+            if item['type'] == 'change':
+                for intraline in item['intraline']:
+                    intralines.append([begin + intraline[0], begin + intraline[1]])
+
+        elif item['type'] == 'fold':
+            folds.append([begin, size - 1])
+
+    return {
+        'content': '\n'.join(content) + '\n',
+        'blocks': blocks,
+        'intralines': intralines,
+        'folds': folds
+    }
+
+
+# builds everything needed to display a diff without touching views, so it can run off the UI thread
+def layout_diff(diff, folding, fold_context, expanded_folds):
+    a = []
+    b = []
+    real_to_view = {'a': LineMapping(), 'b': LineMapping()}
+    view_to_real = {'a': LineMapping(), 'b': LineMapping()}
+    folds = {}
+
+    missing_a = missing_b = 0
+    line_a = line_b = 0
+    content = diff['content']
+
+    for index in range(len(content)):
+        change = content[index]
+
+        if change['skip']:
+            # left out by limited context, only the number of lines is known
+            parts = [(range(change['skip']), True)]
+
+        elif change['ab']:
+            hidden = get_hidden_range(index, len(content), len(change['ab']), line_a, fold_context, expanded_folds) if folding else None
+
+            if hidden is None:
+                parts = [(change['ab'], False)]
+            else:
+                parts = [
+                    (change['ab'][:hidden[0]], False),
+                    (change['ab'][hidden[0]:hidden[1]], True),
+                    (change['ab'][hidden[1]:], False)
+                ]
+
+        if change['skip'] or change['ab']:
+            for lines, folded in parts:
+                if folded:
+                    # all folded lines point to the marker row, so comments on them stay visible
+                    row = line_a + missing_a
+                    marker = '%s %d unchanged lines, select to expand %s' % ('-' * 8, len(lines), '-' * 8)
+
+                    a.append({'lines': [marker], 'type': 'fold'})
+                    b.append({'lines': [marker], 'type': 'fold'})
+
+                    folds.update({row: (line_a + 1, line_a + len(lines), not change['ab'])})
+
+                    real_to_view['a'].add(line_a + 1, row, len(lines), 0)
+                    real_to_view['b'].add(line_b + 1, row, len(lines), 0)
+                    line_a += len(lines)
+                    line_b += len(lines)
+
+                    missing_a -= len(lines) - 1
+                    missing_b -= len(lines) - 1
+                    continue
+
+                if len(lines) == 0:
+                    continue
+
+                a.append({'lines': lines, 'type': 'common'})
+                b.append({'lines': lines, 'type': 'common'})
+
+                real_to_view['a'].add(line_a + 1, line_a + missing_a, len(lines))
+                view_to_real['a'].add(line_a + missing_a, line_a + 1, len(lines))
+
+                real_to_view['b'].add(line_b + 1, line_b + missing_b, len(lines))
+                view_to_real['b'].add(line_b + missing_b, line_b + 1, len(lines))
+                line_a += len(lines)
+                line_b += len(lines)
+        else:
+            a.append({'lines': change['a'], 'type': 'change', 'intraline': get_intralines(diff, 'edit_a', change)})
+            b.append({'lines': change['b'], 'type': 'change', 'intraline': get_intralines(diff, 'edit_b', change)})
+
+            real_to_view['a'].add(line_a + 1, line_a + missing_a, len(change['a']))
+            view_to_real['a'].add(line_a + missing_a, line_a + 1, len(change['a']))
+            line_a += len(change['a'])
+
+            real_to_view['b'].add(line_b + 1, line_b + missing_b, len(change['b']))
+            view_to_real['b'].add(line_b + missing_b, line_b + 1, len(change['b']))
+            line_b += len(change['b'])
+
+            miss_a = len(change['b']) - len(change['a'])
+            miss_b = len(change['a']) - len(change['b'])
+
+            a.append({'lines': [''] * miss_a, 'type': 'missing', 'removal': len(change['a']) == 0})
+            b.append({'lines': [''] * miss_b, 'type': 'missing', 'removal': len(change['b']) == 0})
+
+            missing_a += miss_a if miss_a > 0 else 0
+            missing_b += miss_b if miss_b > 0 else 0
+
+    return {
+        'a': render_side(a),
+        'b': render_side(b),
+        'real_to_view': real_to_view,
+        'view_to_real': view_to_real,
+        'folds': folds
+    }
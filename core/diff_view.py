@@ -23,9 +23,13 @@ import os
 
 from .base_view import BaseView
 from .scroll_sync import ScrollSync
-from .utils import create_tmpfile_path, quick_panel, sort_alpha, sort_num, info_message, is_in_viewport, error_message
+from .utils import quick_panel, sort_alpha, sort_num, info_message, is_in_viewport, error_message
 from .resources import GerritResources
+from .executor import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH
 from .reader import DataReader
+from .line_mapping import LineMapping
+from .diff_layout import layout_diff
+from .syntax_index import SyntaxIndex
 from .settings import Settings
 from .reloader import Reloader
 from .comments import CommentsStore, CommentsBrowser
@@ -56,6 +60,10 @@ class DiffView(BaseView):
         self.regions_b = None
         self.change_selected_index = None
         self.sync = None
+        self.diff_request = None
+        self.render_generation = 0
+        self.prefetched = {}
+        self.published_comments = {}
         self.created = False
         self.old_layout = None
         self.current_file_index = 0
@@ -69,6 +77,10 @@ class DiffView(BaseView):
         self.view_to_real = {}
         self.view_to_focus = None
         self.intralines_visible = True
+        self.folds = {}
+        self.expanded_folds = []
+        self.context = 'ALL'
+        self.limited_context = False
 
         self.load_diff(filename)
         self.opener.settings().set('is_sublimegerrit_diff_view', True)
@@ -87,27 +99,20 @@ class DiffView(BaseView):
     def load_diff(self, filename, base=None):
         self.loading = True
         self.intralines_visible = True
+        self.render_generation += 1
 
         if self.sync:
             self.sync.destroy()
 
+        if self.diff_request is not None:
+            self.diff_request.cancel()
+
         if self.comments is not None:
             self.comments.destroy()
             self.comments = None
 
-        current_ext = os.path.splitext(filename)[1].lower()
-        syntax = None
-        # hack to load a proper syntax file... find a better way to obtain a syntax by extension
-        if self.file_name is not None and os.path.splitext(self.file_name)[1].lower() != current_ext:
-            path = create_tmpfile_path(filename)
-            tmp_view = self.window.open_file(path, sublime.TRANSIENT)
-
-            syntax = tmp_view.settings().get('syntax')
-            self.window.focus_view(tmp_view)
-            self.window.run_command('close')
-
-            self.a.set_syntax_file(syntax)
-            self.b.set_syntax_file(syntax)
+        # builds or loads the syntax index while the diff is being fetched
+        sublime.set_timeout_async(SyntaxIndex.refresh, 0)
 
         self.file_name = filename
         self.active = True
@@ -119,8 +124,13 @@ class DiffView(BaseView):
         self.created = True
         self.revision_id = self.revision['_number']
         self.files_list = {}
-        self.real_to_view = {'a': {}, 'b': {}}
-        self.view_to_real = {'a': {}, 'b': {}}
+        self.real_to_view = {'a': LineMapping(), 'b': LineMapping()}
+        self.view_to_real = {'a': LineMapping(), 'b': LineMapping()}
+        self.folds = {}
+        self.expanded_folds = []
+        self.context = self.get_context()
+        # stays set after a skipped region is loaded in full, so the others remain folded
+        self.limited_context = self.context != 'ALL'
 
         for f in self.revision['files']:
             if 'binary' in self.revision['files'][f]:
@@ -147,32 +157,102 @@ class DiffView(BaseView):
                 return
 
             self.data = DataReader('gerritcodereview#diff').read(data)
+            plan = self.layout()
+
+            sublime.set_timeout(lambda: show_diff(plan), 0)
+
+        def set_syntax():
+            if self.destroying or self.file_name != filename:
+                return
+
+            syntax = SyntaxIndex.find(filename)
+            self.a.set_syntax_file(syntax)
+            self.b.set_syntax_file(syntax)
+
+        def show_diff(plan):
+            # another file may have been requested meanwhile
+            if self.destroying or self.file_name != filename or self.base != base:
+                return
+
             self.change_layout()
 
             self.render_loader(self.a)
             self.render_loader(self.b)
 
-            self.insert_diff()
+            if SyntaxIndex.is_ready():
+                set_syntax()
+            else:
+                # the async thread runs tasks in order, so this comes after the index is built
+                sublime.set_timeout_async(lambda: sublime.set_timeout(set_syntax, 0), 0)
+
+            self.insert_diff(plan)
             self.get_comments()
             self.resources.set_reviewed(self.change_id, self.revision_id, self.file_name).start()
 
-            # hack to load proper syntax from fallback definitions, i.e. for xul files
-            syntax = self.a.settings().get('syntax') or self.b.settings().get('syntax')
-            fallbacks = Settings.get('diff.fallback_syntaxes')
-            if current_ext in fallbacks:
-                syntax = fallbacks[current_ext]
-
-            self.a.set_syntax_file(syntax)
-            self.b.set_syntax_file(syntax)
-
             if len(self.regions_a) == 0:
                 info_message('There are no differences')
 
             sublime.set_timeout(sync, 500)
 
             self.loading = False
+            self.prefetch()
 
-        self.resources.diff(self.change_id, self.revision_id, filename, base).then(insert_diff)
+        def insert_prefetched(data):
+            # prefetch is silent, so ask again to get the error reported
+            if data is None:
+                self.diff_request = self.request_diff(filename, base).then(insert_diff)
+            else:
+                # a finished prefetch calls back right away on the UI thread, parsing and layout must not run there
+                sublime.set_timeout_async(lambda: insert_diff(data), 0)
+
+        prefetched = self.prefetched.pop((filename, base), None)
+
+        if prefetched is not None and not prefetched.is_cancelled():
+            self.diff_request = prefetched.set_priority(PRIORITY_INTERACTIVE).then(insert_prefetched)
+        else:
+            self.diff_request = self.request_diff(filename, base).then(insert_diff)
+
+    def get_context(self):
+        if Settings.get('diff.limited_context'):
+            return max(int(Settings.get('diff.fold_context') or 0), 1)
+
+        return 'ALL'
+
+    def request_diff(self, filename, base, silent=False):
+        # commit SHA makes the diff cacheable
+        revision_id = self.revision['revision'] if 'revision' in self.revision else self.revision_id
+
+        return self.resources.diff(self.change_id, revision_id, filename, base, silent, self.context)
+
+    def prefetch(self):
+        depth = int(Settings.get('diff.prefetch_depth') or 0)
+        max_lines = int(Settings.get('diff.prefetch_max_lines') or 0)
+        file_names = sort_alpha(list(self.files_list.keys()))
+        index = file_names.index(self.file_name)
+        wanted = []
+
+        for distance in range(1, depth + 1):
+            for neighbour in [index + distance, index - distance]:
+                if neighbour < 0 or neighbour >= len(file_names):
+                    continue
+
+                fdata = self.files_list[file_names[neighbour]]
+                lines = fdata.get('lines_inserted', 0) + fdata.get('lines_deleted', 0)
+
+                if max_lines and lines > max_lines:
+                    continue
+
+                wanted.append((file_names[neighbour], self.base))
+
+        for key in list(self.prefetched.keys()):
+            if key not in wanted:
+                self.prefetched.pop(key).cancel()
+
+        for key in wanted:
+            if key not in self.prefetched:
+                self.prefetched.update({
+                    key: self.request_diff(key[0], key[1], True).set_priority(PRIORITY_PREFETCH).start()
+                })
 
 
     def is_my_view(self, view):
@@ -222,7 +302,7 @@ class DiffView(BaseView):
             self.set_layout({"cols": cols, "rows": rows, "cells": cells})
 
         if not self.a:
-            self.a = self.window.open_file(create_tmpfile_path((self.data[0]['meta_a'] or self.data[0]['meta_b'])['name'])) #hack: loads apropriate syntax for file by its extension.
+            self.a = self.window.new_file()
             self.setup_view(self.a)
             self.window.set_view_index(self.a, len(cells)-1, 0)
             self.a.settings().set('is_sublimegerrit_diff_view', True)
@@ -250,7 +330,7 @@ class DiffView(BaseView):
             self.set_layout({"cols": cols, "rows": rows, "cells": cells})
 
         if not self.b:
-            self.b = self.window.open_file(create_tmpfile_path((self.data[0]['meta_b'] or self.data[0]['meta_a'])['name'])) #hack: loads apropriate syntax for file by its extension.
+            self.b = self.window.new_file()
             self.setup_view(self.b)
             self.window.set_view_index(self.b, len(cells)-1, 0)
             self.b.settings().set('is_sublimegerrit_diff_view', True)
@@ -285,174 +365,150 @@ class DiffView(BaseView):
 
         view.set_scratch(True)
 
-    def insert_diff(self):
-        def insert(view, data):
-            view.run_command('sublime_gerrit_clear')
-            content = []
-            regions = []
-            line_regions = []
-            change_regions = []
-            intralines = []
-
-            i = 0
-            begin = 0
-            size = 0
-
-            for item in data:
-                begin = size
-
-                if len(item['lines']) > 0:
-                    content += item['lines']
-                    size += sum([len(line) + 1 for line in item['lines']])
-
-                    if item['type'] in ['change', 'missing']:
-                        region = sublime.Region(begin, size)
+    def layout(self):
+        diff = self.data[0]
+        total_lines = sum(len(change['ab'] or change['b'] or []) for change in diff['content'])
+        fold_threshold = int(Settings.get('diff.fold_threshold') or 0)
+        folding = self.limited_context or (fold_threshold > 0 and total_lines > fold_threshold)
 
-                        if item['type'] == 'missing':
-                            color = Settings.get('diff.block_missing')
-                            if Settings.get('diff.block_draw_outlined'):
-                                flags = 0
-                            else:
-                                flags = sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE
+        return layout_diff(diff, folding, int(Settings.get('diff.fold_context') or 0), list(self.expanded_folds))
 
-                        else:
-                            if Settings.get('diff.block_draw_outlined'):
-                                flags = sublime.DRAW_NO_FILL
-                            else:
-                                flags = sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE
-
-                            if view in [self.a]:
-                                color = Settings.get('diff.block_deleted')
-                            else:
-                                color = Settings.get('diff.block_inserted')
-
-                        definition = ['region-%d' % i, [region], color, '', flags]
-
-                        regions.append(definition)
-
-                        if not Settings.get('diff.block_draw_outlined'):
-                            ends = 0
-                            for j in range(0, len(item['lines'])):
-                                line_region = sublime.Region(begin + ends, begin + ends)
-                                line_regions.append(['region-%d-%d' % (i, j), [line_region], color, '', sublime.DRAW_EMPTY])
-                                ends += len(item['lines'][j]) + 1
+    def insert_diff(self, plan):
+        def insert(view, plan):
+            view.run_command('sublime_gerrit_clear')
+            # regions are grouped by style, one key each, the blocks themselves are kept for navigation
+            regions = {'changes': [], 'missing': [], 'change_lines': [], 'missing_lines': []}
+            change_regions = []
 
-                        if item['type'] == 'change' or (item['type'] == 'missing' and item['removal']):
-                            change_regions.append(definition)
+            for block in plan['blocks']:
+                region = sublime.Region(block['begin'], block['end'])
+                lines = [sublime.Region(begin, begin) for begin in block['line_starts']]
 
-                        if item['type'] == 'change':
-                            for intraline in item['intraline']:
-                                intralines.append(
-                                    sublime.Region(begin + intraline[0], begin + intraline[1])
-                                )
+                if block['type'] == 'missing':
+                    regions['missing'].append(region)
+                    regions['missing_lines'] += lines
+                else:
+                    regions['changes'].append(region)
+                    regions['change_lines'] += lines
 
-                i += 1
+                if block['type'] == 'change' or block['removal']:
+                    change_regions.append(region)
 
             view.run_command('sublime_gerrit_insert', {
-                'content': '\n'.join(content) + '\n',
+                'content': plan['content'],
                 'pos': 0
             })
 
-            if Settings.get('diff.block_intraline_draw_outlined'):
+            outlined = Settings.get('diff.block_draw_outlined')
+            color = Settings.get('diff.block_deleted') if view in [self.a] else Settings.get('diff.block_inserted')
+
+            if outlined:
+                view.add_regions('changes', regions['changes'], color, '', sublime.DRAW_NO_FILL)
+                view.add_regions('missing', regions['missing'], Settings.get('diff.block_missing'), '', 0)
+            else:
+                view.add_regions('changes', regions['changes'], color, '', sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE)
+                view.add_regions('missing', regions['missing'], Settings.get('diff.block_missing'), '', sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE)
+
+            view.add_regions('change_lines', [] if outlined else regions['change_lines'], color, '', sublime.DRAW_EMPTY)
+            view.add_regions('missing_lines', [] if outlined else regions['missing_lines'], Settings.get('diff.block_missing'), '', sublime.DRAW_EMPTY)
+
+            if not self.intralines_visible:
+                flags = sublime.HIDDEN
+            elif Settings.get('diff.block_intraline_draw_outlined'):
                 flags = sublime.DRAW_NO_FILL | sublime.HIDE_ON_MINIMAP
             else:
                 flags = sublime.DRAW_NO_OUTLINE | sublime.HIDE_ON_MINIMAP
 
-            regions.append([
+            view.add_regions(
                 'intralines',
-                intralines,
+                [sublime.Region(begin, end) for begin, end in plan['intralines']],
                 Settings.get('diff.block_intraline'),
                 '',
                 flags
-            ])
-
-            for region in regions:
-                view.add_regions(*region)
+            )
 
-            for region in line_regions:
-                view.add_regions(*region)
+            view.add_regions('folds', [sublime.Region(begin, end) for begin, end in plan['folds']], 'comment', '', sublime.DRAW_NO_OUTLINE)
 
             return change_regions
 
+        self.real_to_view = plan['real_to_view']
+        self.view_to_real = plan['view_to_real']
+        self.folds = plan['folds']
 
-        a = []
-        b = []
+        self.regions_a = insert(self.a, plan['a'])
+        self.regions_b = insert(self.b, plan['b'])
 
-        # self.update_title_a()
-        # self.update_title_b()
-
-        def intralines(edit, change):
-            result = []
-            last_edit = {
-                'edit_a': 0,
-                'edit_b': 0
-            }
-            if self.data[0]['intraline_status'] == 'OK':
-                for intra in change[edit]:
-                    begin = last_edit[edit] + intra[0]
-                    end = begin + intra[1]
-                    last_edit[edit] = end
+        self.window.focus_view(self.a)
+        self.window.focus_view(self.b)
 
-                    result.append([begin, end])
+        self.a.set_read_only(True)
+        self.b.set_read_only(True)
 
-            return result
+        if len(self.regions_a) > 0:
+            self.a.show_at_center(sublime.Region(self.regions_a[0].begin(), self.regions_a[0].begin()))
+            self.b.show_at_center(sublime.Region(self.regions_b[0].begin(), self.regions_b[0].begin()))
 
-        missing_a = missing_b = 0
-        line_a = line_b = 0
 
-        for change in self.data[0]['content']:
-            if change['ab']:
-                a.append({'lines': change['ab'], 'type': 'common'})
-                b.append({'lines': change['ab'], 'type': 'common'})
+        self.a.sel().clear()
+        self.b.sel().clear()
+        self.window.run_command('hide_panel', {'cancel': True})
 
-                for i in range(len(change['ab'])):
-                    self.real_to_view['a'].update({line_a + 1: line_a + missing_a})
-                    self.view_to_real['a'].update({line_a + missing_a: line_a + 1})
+    def expand_fold(self, row):
+        first, last, skipped = self.folds[row]
+        self.expanded_folds.append((first, last))
 
-                    self.real_to_view['b'].update({line_b + 1: line_b + missing_b})
-                    self.view_to_real['b'].update({line_b + missing_b: line_b + 1})
-                    line_a += 1
-                    line_b += 1
-            else:
-                a.append({'lines': change['a'], 'type': 'change', 'intraline': intralines('edit_a', change)})
-                b.append({'lines': change['b'], 'type': 'change', 'intraline': intralines('edit_b', change)})
+        if skipped:
+            self.load_full_context(row)
+        else:
+            self.render_expanded(row)
 
-                for i in range(len(change['a'])):
-                    self.real_to_view['a'].update({line_a + 1: line_a + missing_a})
-                    self.view_to_real['a'].update({line_a + missing_a: line_a + 1})
-                    line_a += 1
+    def load_full_context(self, row):
+        generation = self.render_generation
 
-                for i in range(len(change['b'])):
-                    self.real_to_view['b'].update({line_b + 1: line_b + missing_b})
-                    self.view_to_real['b'].update({line_b + missing_b: line_b + 1})
-                    line_b += 1
+        def loaded(data):
+            if generation != self.render_generation:
+                return
 
-                miss_a = len(change['b']) - len(change['a'])
-                miss_b = len(change['a']) - len(change['b'])
+            if data is None or self.destroying:
+                self.loading = False
+                return
 
-                a.append({'lines': [''] * miss_a, 'type': 'missing', 'removal': len(change['a']) == 0})
-                b.append({'lines': [''] * miss_b, 'type': 'missing', 'removal': len(change['b']) == 0})
+            self.data = DataReader('gerritcodereview#diff').read(data)
+            self.render_expanded(row)
 
-                missing_a += miss_a if miss_a > 0 else 0
-                missing_b += miss_b if miss_b > 0 else 0
+        self.loading = True
+        self.context = 'ALL'
+        self.diff_request = self.request_diff(self.file_name, self.base).then(loaded)
+
+    def render_expanded(self, row):
+        self.render_generation += 1
+        generation = self.render_generation
+        file_name = self.file_name
+        base = self.base
+
+        def render(plan):
+            # another file, base or expansion was requested meanwhile
+            if generation != self.render_generation or self.file_name != file_name or self.base != base:
+                return
 
-        self.regions_a = insert(self.a, a)
-        self.regions_b = insert(self.b, b)
+            self.loading = False
 
-        self.window.focus_view(self.a)
-        self.window.focus_view(self.b)
+            if self.destroying:
+                return
 
-        self.a.set_read_only(True)
-        self.b.set_read_only(True)
+            self.insert_diff(plan)
+            self.get_comments()
 
-        if len(self.regions_a) > 0:
-            self.a.show_at_center(sublime.Region(self.regions_a[0][1][0].begin(), self.regions_a[0][1][0].begin()))
-            self.b.show_at_center(sublime.Region(self.regions_b[0][1][0].begin(), self.regions_b[0][1][0].begin()))
+            point = self.b.text_point(row, 0)
+            self.a.show_at_center(point)
+            self.b.show_at_center(point)
 
+        def build():
+            plan = self.layout()
+            sublime.set_timeout(lambda: render(plan), 0)
 
-        self.a.sel().clear()
-        self.b.sel().clear()
-        self.window.run_command('hide_panel', {'cancel': True})
+        self.loading = True
+        sublime.set_timeout_async(build, 0)
 
     def select_rows_in(self, view, rows):
         self.window.focus_view(view)
@@ -525,9 +581,23 @@ class DiffView(BaseView):
             self.change_id,
             self.revision_id,
             self.base,
-            self.on_load_comments
+            self.on_load_comments,
+            self.get_published_comments
         )
 
+    # published comments are per revision, so they are loaded once for all files
+    def get_published_comments(self, revision_id):
+        request = self.published_comments.get(revision_id)
+
+        if request is None or request.is_cancelled() or (request.is_done() and request.value is None):
+            request = self.resources.get_comments(self.change_id, revision_id)
+            self.published_comments.update({revision_id: request})
+
+        return request
+
+    def forget_published_comments(self):
+        self.published_comments = {}
+
     def on_load_comments(self, comments_store):
         self.update_title_a(comments_store)
         self.update_title_b(comments_store)
@@ -539,6 +609,17 @@ class DiffView(BaseView):
         comments_store.get_collection_by_view(self.b).remove_draft_callback = lambda draft: self.update_title_b(comments_store)
 
     def display_base_change_menu(self):
+        instance = BaseView.find_instance_by_view(self.opener)
+
+        # older patch sets are not known until the change view loads full detail
+        if instance is not None and instance.has_partial_detail():
+            def loaded():
+                self.revisions = instance.get_ordered_revisions()
+                self.display_base_change_menu()
+
+            instance.load_full_detail(loaded)
+            return
+
         items = []
 
         items.append({
@@ -682,7 +763,7 @@ class DiffView(BaseView):
         for i in range(len(self.regions_a)):
             items.append({
                 'caption': ['Change %d' % (i + 1)],
-                'regions': (self.regions_a[i][1][0].begin(), self.regions_b[i][1][0].begin()),
+                'regions': (self.regions_a[i].begin(), self.regions_b[i].begin()),
                 'index': i,
                 'on_over': select_change,
                 'on_out': deselect_change
@@ -701,8 +782,8 @@ class DiffView(BaseView):
             self.change_selected_index -= 1
 
         selected = (
-            self.regions_a[self.change_selected_index][1][0].begin(),
-            self.regions_b[self.change_selected_index][1][0].begin()
+            self.regions_a[self.change_selected_index].begin(),
+            self.regions_b[self.change_selected_index].begin()
         )
 
         region_a = sublime.Region(selected[0], selected[0])
@@ -733,11 +814,15 @@ class DiffView(BaseView):
         self.opener.settings().erase('is_sublimegerrit_diff_view')
 
         self.destroying = True
+        self.resources.cancel_all()
         self.window.run_command('hide_panel', {'cancel': True})
         if self.sync:
             self.sync.destroy()
             self.sync = None
 
+        if self.comments is not None:
+            self.comments.destroy()
+
         if self.a is not None and self.a.window() is not None:
             self.window.focus_view(self.a)
             self.window.run_command('close')
@@ -797,7 +882,7 @@ class DiffView(BaseView):
 
 
     def show_base_change_menu_cmd(self):
-        return self.display_base_change_menu if len(self.revisions) > 1 else False
+        return self.display_base_change_menu if len(self.revisions) > 1 or self.current_rev_num > 1 else False
 
     def show_file_change_menu_cmd(self):
         return self.display_files_menu if len(self.files_list.keys()) > 1 else False
@@ -840,6 +925,9 @@ class DiffView(BaseView):
 
 
     def on_selection_modified(self, view):
+        if self.sync:
+            self.sync.kick()
+
         if self.handling_selection or self.loading or any([sel.size() > 1 for sel in view.sel()]):
             return
 
@@ -847,6 +935,15 @@ class DiffView(BaseView):
             self.view_to_focus = view
 
         sel = view.sel()
+
+        if view in [self.a, self.b] and len(sel) == 1 and sel[0].empty():
+            row, col = view.rowcol(sel[0].begin())
+
+            if row in self.folds:
+                self.view_to_focus = None
+                self.expand_fold(row)
+                return
+
         self.handling_selection = True
         to_select = []
         size = view.size()
@@ -906,13 +1003,33 @@ class DiffView(BaseView):
         self.view_to_focus = None
 
     def on_activated(self, view):
-        pass
+        if self.sync:
+            self.sync.kick()
 
     def on_modified(self, view):
         pass
 
     def on_deactivated(self, view):
-        pass
+        if not self.sync:
+            return
+
+        generation = self.sync.generation
+
+        def pause():
+            # a pane got focus again meanwhile
+            if not self.sync or self.sync.generation != generation:
+                return
+
+            window = sublime.active_window()
+            active = window.active_view() if window is not None else None
+
+            # another view of this window has focus, the panes can still be scrolled with the mouse
+            if window is not None and window.id() == self.window.id() and active is not None and active.id() not in [self.a.id(), self.b.id()]:
+                return
+
+            self.sync.pause()
+
+        sublime.set_timeout(pause, 50)
 
     def on_close(self, view):
         self.destroy()
@@ -0,0 +1,146 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+try:
+    import zlib
+except ImportError:
+    zlib = None
+
+from .utils import log, is_debug
+
+
+class DiskCache():
+    FORMAT = 2
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0}
+
+    def configure(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+
+    def file_name(self, key):
+        return os.path.join(self.path, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, key):
+        file_name = self.file_name(key)
+
+        try:
+            with open(file_name, 'rb') as f:
+                raw = zlib.decompress(f.read())
+
+            meta, data = raw.split(b'\n', 1)
+            meta = json.loads(meta.decode('utf-8'))
+
+            if meta['key'] != repr(key) or meta.get('format') != DiskCache.FORMAT:
+                raise ValueError('key mismatch')
+
+            # modification time is what eviction orders by
+            os.utime(file_name, None)
+        except (IOError, OSError, ValueError, KeyError, UnicodeError, zlib.error):
+            self.stats['misses'] += 1
+            return None
+
+        self.stats['hits'] += 1
+        self.log()
+
+        return {'etag': meta['etag'], 'content_type': meta['content_type'], 'data': data.decode('utf-8')}
+
+    def put(self, key, etag, content_type, data):
+        meta = json.dumps({'key': repr(key), 'format': DiskCache.FORMAT, 'etag': etag, 'content_type': content_type})
+        compressed = zlib.compress(meta.encode('utf-8') + b'\n' + data.encode('utf-8'))
+        file_name = self.file_name(key)
+        temp_name = '%s.%d.tmp' % (file_name, threading.get_ident())
+
+        with self.lock:
+            try:
+                if not os.path.isdir(self.path):
+                    os.makedirs(self.path)
+
+                if self.size is None:
+                    self.size = sum(size for name, size, mtime in self.list_files())
+
+                if os.path.isfile(file_name):
+                    self.size -= os.path.getsize(file_name)
+
+                with open(temp_name, 'wb') as f:
+                    f.write(compressed)
+
+                os.replace(temp_name, file_name)
+                self.size += len(compressed)
+                self.stats['writes'] += 1
+                self.evict()
+            except (IOError, OSError) as e:
+                log('Disk cache write failed', e)
+
+        self.log()
+
+    def list_files(self):
+        files = []
+
+        for name in os.listdir(self.path):
+            if not name.endswith('.cache'):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+
+            files.append((name, stat.st_size, stat.st_mtime))
+
+        return files
+
+    def evict(self):
+        if self.size <= self.max_bytes:
+            return
+
+        files = sorted(self.list_files(), key=lambda f: f[2])
+        self.size = sum(size for name, size, mtime in files)
+
+        for name, size, mtime in files:
+            if self.size <= self.max_bytes:
+                break
+
+            try:
+                os.remove(os.path.join(self.path, name))
+                self.size -= size
+            except OSError:
+                pass
+
+    def log(self):
+        if not is_debug():
+            return
+
+        log('Disk cache: %d hits, %d misses, %d writes, %d bytes' % (
+            self.stats['hits'],
+            self.stats['misses'],
+            self.stats['writes'],
+            self.size or 0
+        ))
@@ -0,0 +1,273 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+import sublime
+import threading
+import traceback
+import time
+from collections import deque
+
+from .utils import log, is_debug
+
+
+class PromiseTimeout(Exception):
+    pass
+
+
+class Promise():
+    @classmethod
+    def all(self, promises):
+        combined = Promise()
+        results = [None] * len(promises)
+        remaining = [len(promises)]
+
+        def collect(index, value):
+            results[index] = value
+            remaining[0] -= 1
+
+            if remaining[0] == 0:
+                combined.resolve(results)
+
+        if len(promises) == 0:
+            combined.resolve([])
+
+        for index in range(0, len(promises)):
+            promises[index].then(lambda value, index=index: collect(index, value))
+
+        combined.children = promises
+
+        return combined
+
+    @classmethod
+    def any(self, promises):
+        combined = Promise()
+
+        for promise in promises:
+            promise.then(combined.resolve)
+
+        combined.children = promises
+
+        return combined
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.callbacks = []
+        self.children = []
+        self.value = None
+        self.done = False
+        self.cancelled = False
+
+    def resolve(self, value):
+        with self.lock:
+            if self.done:
+                return False
+
+            self.done = True
+            self.value = value
+            callbacks = self.callbacks
+            self.callbacks = []
+
+        self.event.set()
+
+        for callback in callbacks:
+            self.run_callback(callback, value)
+
+        return True
+
+    def run_callback(self, callback, value):
+        try:
+            callback(value)
+        except Exception:
+            traceback.print_exc()
+
+    def cancel(self):
+        with self.lock:
+            if self.done:
+                return False
+
+            self.done = True
+            self.cancelled = True
+            self.callbacks = []
+
+        self.event.set()
+
+        for child in self.children:
+            child.cancel()
+
+        self.on_cancel()
+
+        return True
+
+    def on_cancel(self):
+        pass
+
+    def add_callback(self, callback):
+        with self.lock:
+            if not self.done:
+                self.callbacks.append(callback)
+                return
+
+            if self.cancelled:
+                return
+
+        self.run_callback(callback, self.value)
+
+    def then(self, callback):
+        chained = Promise()
+        chained.children = [self]
+
+        def run(value):
+            result = callback(value)
+
+            if isinstance(result, Promise):
+                result.then(chained.resolve)
+            else:
+                chained.resolve(result)
+
+        self.add_callback(run)
+
+        return chained
+
+    def timeout(self, seconds):
+        sublime.set_timeout(self.cancel, int(seconds * 1000))
+
+        return self
+
+    def wait(self, timeout=None):
+        if not self.event.wait(timeout):
+            raise PromiseTimeout('Promise not resolved within %s seconds' % timeout)
+
+        return self.value
+
+    def is_done(self):
+        return self.done
+
+    def is_cancelled(self):
+        return self.cancelled
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = ['interactive', 'prefetch', 'background']
+
+
+class Executor():
+    def __init__(self, max_workers, max_background=1, idle_timeout=30):
+        self.max_workers = max_workers
+        self.max_background = max_background
+        self.idle_timeout = idle_timeout
+        self.queues = [deque() for name in PRIORITY_NAMES]
+        self.running = [0 for name in PRIORITY_NAMES]
+        self.wait_stats = [{'count': 0, 'total': 0.0, 'max': 0.0} for name in PRIORITY_NAMES]
+        self.condition = threading.Condition()
+        self.workers = 0
+        self.idle_workers = 0
+
+    def configure(self, max_workers, max_background=1):
+        with self.condition:
+            self.max_workers = max_workers
+            self.max_background = max_background
+            self.condition.notify_all()
+
+    def submit(self, task, priority=PRIORITY_INTERACTIVE):
+        with self.condition:
+            self.queues[priority].append((task, time.time()))
+
+            # a burst gets as many workers as it has tasks, not only the ones that happen to be idle
+            queued = sum(len(queue) for queue in self.queues)
+
+            if queued > self.idle_workers and self.workers < self.max_workers:
+                self.workers += 1
+                threading.Thread(target=self.work, daemon=True).start()
+
+            self.condition.notify_all()
+
+    def pick(self):
+        if len(self.queues[PRIORITY_INTERACTIVE]) > 0:
+            return PRIORITY_INTERACTIVE
+
+        # always keep one worker free for interactive requests
+        non_interactive = self.running[PRIORITY_PREFETCH] + self.running[PRIORITY_BACKGROUND]
+
+        if non_interactive >= max(1, self.max_workers - 1):
+            return None
+
+        if len(self.queues[PRIORITY_PREFETCH]) > 0:
+            return PRIORITY_PREFETCH
+
+        if len(self.queues[PRIORITY_BACKGROUND]) > 0 and self.running[PRIORITY_BACKGROUND] < self.max_background:
+            return PRIORITY_BACKGROUND
+
+        return None
+
+    def next_task(self):
+        with self.condition:
+            priority = self.pick()
+
+            while priority is None:
+                self.idle_workers += 1
+                notified = self.condition.wait(self.idle_timeout)
+                self.idle_workers -= 1
+
+                priority = self.pick()
+
+                # idle workers exit, so threads left by a plugin reload go away too
+                if priority is None and not notified:
+                    self.workers -= 1
+                    return None, None
+
+            task, queued_at = self.queues[priority].popleft()
+            self.running[priority] += 1
+
+            waited = time.time() - queued_at
+            stats = self.wait_stats[priority]
+            stats['count'] += 1
+            stats['total'] += waited
+            stats['max'] = max(stats['max'], waited)
+
+            if is_debug():
+                log('Queue wait [%s]: %.1f ms, avg %.1f ms, max %.1f ms, %d queued' % (
+                    PRIORITY_NAMES[priority],
+                    waited * 1000,
+                    stats['total'] * 1000 / stats['count'],
+                    stats['max'] * 1000,
+                    len(self.queues[priority])
+                ))
+
+            return task, priority
+
+    def work(self):
+        while True:
+            task, priority = self.next_task()
+
+            if task is None:
+                return
+
+            try:
+                task()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self.condition:
+                    self.running[priority] -= 1
+                    self.condition.notify_all()
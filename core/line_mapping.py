@@ -0,0 +1,92 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+
+from bisect import bisect_right
+
+
+class LineMapping():
+    def __init__(self):
+        self.starts = []
+        self.targets = []
+        self.lengths = []
+        self.steps = []
+
+    def clear(self):
+        del self.starts[:]
+        del self.targets[:]
+        del self.lengths[:]
+        del self.steps[:]
+
+    # segments must be added in ascending order, step 0 maps the whole run to a single target
+    def add(self, source, target, count=1, step=1):
+        if count <= 0:
+            return
+
+        if len(self.starts) > 0:
+            last = len(self.starts) - 1
+
+            if source < self.starts[last] + self.lengths[last]:
+                raise ValueError('Line %d added out of order' % source)
+
+            if (
+                self.steps[last] == step and
+                self.starts[last] + self.lengths[last] == source and
+                self.targets[last] + self.lengths[last] * step == target
+            ):
+                self.lengths[last] += count
+                return
+
+        self.starts.append(source)
+        self.targets.append(target)
+        self.lengths.append(count)
+        self.steps.append(step)
+
+    def get(self, source, default=None):
+        index = bisect_right(self.starts, source) - 1
+
+        if index < 0:
+            return default
+
+        offset = source - self.starts[index]
+
+        if offset >= self.lengths[index]:
+            return default
+
+        return self.targets[index] + offset * self.steps[index]
+
+    def items(self):
+        for index in range(len(self.starts)):
+            for offset in range(self.lengths[index]):
+                yield self.starts[index] + offset, self.targets[index] + offset * self.steps[index]
+
+    def __getitem__(self, source):
+        target = self.get(source)
+
+        if target is None:
+            raise KeyError(source)
+
+        return target
+
+    def __contains__(self, source):
+        return self.get(source) is not None
+
+    def __len__(self):
+        return sum(self.lengths)
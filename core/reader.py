@@ -21,37 +21,63 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 import sublime
 import re
 from .settings import Settings
-from .utils import log
+from .utils import log, is_debug, summarize
 
 class ReaderConfigError(Exception):
     pass
 
-class DataReader():
-    def __init__(self, kind):
-        self.kind = kind
+def compile_path(path):
+    if not path:
+        return None
 
-    def get_by_path(self, data, path):
-        if path:
-            path = path.split('.')
-            current = data
+    keys = []
 
-            for value in path:
-                if re.match('^\d+$', value):
-                    value = int(value)
+    for value in path.split('.'):
+        if re.match('^\d+$', value):
+            value = int(value)
 
-                if value in current:
-                    current = current[value];
-                else:
-                    return ''
+        keys.append(value)
 
-            return current
+    return tuple(keys)
 
+
+def resolve_path(data, keys):
+    if keys is None:
+        return data
+
+    current = data
+
+    for key in keys:
+        if key in current:
+            current = current[key]
         else:
-            return data
+            return ''
 
+    return current
 
-    def map(self, records, mappings):
+
+class CompiledReader():
+    def __init__(self, root, mappings, group_by):
+        self.root = compile_path(root)
+        self.group_by = compile_path(group_by)
+        self.fields = []
+
+        if mappings:
+            for name in mappings:
+                field_path = mappings[name]
+
+                if isinstance(field_path, dict):
+                    self.fields.append((name, None, CompiledReader(
+                        field_path['root'],
+                        field_path['mappings'],
+                        field_path['group_by'] if 'group_by' in field_path else None
+                    )))
+                else:
+                    self.fields.append((name, compile_path(field_path), None))
+
+    def map(self, records):
         ret = []
+        fields = self.fields
 
         if not isinstance(records, list):
             records = [records]
@@ -59,125 +85,137 @@ class DataReader():
         for record in records:
             newRecord = {}
 
-            if mappings:
-                for mapping in mappings:
-                    field_path = mappings[mapping]
-
-                    if isinstance(field_path, dict):
-                        newRecord.update({
-                            mapping: self._read(
-                                root=field_path['root'],
-                                data=record,
-                                mappings=field_path['mappings'],
-                                group_by=field_path['group_by'] if 'group_by' in field_path else None
-                            )
-                        })
-
-                    else:
-                        newRecord.update({
-                            mapping: self.get_by_path(record, field_path)
-                        })
+            for name, keys, reader in fields:
+                if reader is not None:
+                    newRecord[name] = reader.read(record)
+                else:
+                    newRecord[name] = resolve_path(record, keys)
 
             ret.append(newRecord)
 
         return ret
 
+    def read(self, data):
+        records = self.map(resolve_path(data, self.root))
+
+        if self.group_by is None:
+            return records
 
-    def _read(self, root, data, mappings, group_by):
-        records = self.map(self.get_by_path(data, root), mappings)
         grouped = {}
         is_grouped = False
 
-        records_length = len(records)
-
-        for i in range(0, records_length):
-            record = records[i]
-
-            # for path in subModel:
-
-            #     SubModelClass = subModel[path];
-            #     subRecords = self.get_by_path(record, path)
-            #     subRecordsLength = len(subRecords)
+        for record in records:
+            group_value = resolve_path(record, self.group_by)
 
-            #     for j in range(0, subRecordsLength):
-            #         subRecords[j] = SubModelClass(subRecords[j])
-                    # subRecords[j].getDataProvider = function () {
-                    #     return self.dataProvider;
-                    # };
+            if group_value:
+                is_grouped = True
 
-            # groupValue;
+                if not group_value in grouped:
+                    grouped.update({group_value: []})
 
-            # records[i] = ModelClass(record)
+                grouped[group_value].append(record)
 
-            # records[i].getDataProvider = function () {
-            #     return self.dataProvider;
-            # };
+        return grouped if is_grouped else records
 
-            if group_by:
-                group_value = self.get_by_path(records[i], group_by)
 
-                if group_value:
-                    is_grouped = True
+class DataReader():
+    settings = None
+    compiled = {}
+
+    @classmethod
+    def get_settings(self):
+        if DataReader.settings is None:
+            DataReader.settings = sublime.load_settings('SublimeGerritReaders.sublime-settings')
+            DataReader.settings.clear_on_change('SublimeGerritReader')
+            DataReader.settings.add_on_change('SublimeGerritReader', DataReader.invalidate)
+
+        return DataReader.settings
+
+    @classmethod
+    def invalidate(self):
+        log('Readers configuration changed, recompiling')
+        DataReader.compiled = {}
+
+    @classmethod
+    def get_reader(self, kind):
+        compiled = DataReader.compiled
+
+        if kind not in compiled:
+            config = self.get_settings().get(kind)
+
+            if not config:
+                compiled[kind] = None
+            elif isinstance(config['root'], dict):
+                mappings = config['mappings']
+                group_by = config['group_by'] if 'group_by' in config else None
+
+                compiled[kind] = dict((name, CompiledReader(
+                    config['root'][name],
+                    mappings[name] if isinstance(mappings, dict) else None,
+                    group_by[name] if isinstance(group_by, dict) else None
+                )) for name in config['root'])
+            else:
+                compiled[kind] = CompiledReader(
+                    config['root'],
+                    config['mappings'],
+                    config['group_by'] if 'group_by' in config else None
+                )
+
+        return compiled[kind]
 
-                    if not group_value in grouped:
-                        grouped.update({group_value: []})
+    def __init__(self, kind):
+        self.kind = kind
 
-                    grouped[group_value].append(records[i])
+    def get_by_path(self, data, path):
+        return resolve_path(data, compile_path(path))
 
-        return grouped if is_grouped else records
+    def map(self, records, mappings):
+        return CompiledReader(None, mappings, None).map(records)
 
+    def _read(self, root, data, mappings, group_by):
+        return CompiledReader(root, mappings, group_by).read(data)
 
     def read(self, data, reader_name=None):
         if data is None or isinstance(data, str):
             return data
 
-        config = None
-
-        settings = sublime.load_settings('SublimeGerritReaders.sublime-settings')
+        kind = None
 
         if reader_name is None:
             if isinstance(data, dict) and 'kind' in data:
                 log('Got response kind: ', data['kind'])
-                config = settings.get(data['kind'])
+                kind = data['kind']
             elif isinstance(data, list) and len(data) > 0 and ('kind' in data[0] or self.kind):
                 kind = ('kind' in data[0] and data[0]['kind']) or self.kind
 
                 log('Got response kind: list of', kind)
-                config = settings.get(kind)
 
             elif self.kind:
-                config = settings.get(self.kind)
+                kind = self.kind
         else:
             log('Forcing reader for response:', reader_name)
-            config = settings.get(reader_name)
+            kind = reader_name
 
-        if not config:
-            log('No reader for this kind configured, return as-is', data)
-            return data
+        reader = self.get_reader(kind) if kind else None
 
-        root = config['root']
-        mappings = config['mappings']
-        group_by = config['group_by'] if 'group_by' in config else None
+        if not reader:
+            if is_debug():
+                log('No reader for this kind configured, return as-is', summarize(data))
 
-        result = None
+            return data
 
-        if isinstance(root, dict):
+        if isinstance(reader, dict):
             result = {}
 
-            for name in root:
-                root = root[name]
-
-                mappings = mappings[name] if isinstance(mappings, dict) else None
-                group_by = group_by[name] if isinstance(group_by, dict) else None
-
+            for name in reader:
                 result.update({
-                    name: self._read(root, data, mappings, group_by)
+                    name: reader[name].read(data)
                 })
         else:
-            result = self._read(root, data, mappings, group_by)
+            result = reader.read(data)
 
-        log('=====================================')
-        log(result)
+        if is_debug():
+            log('=====================================')
+            log(summarize(result))
 
         return result
-
@@ -19,10 +19,11 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 """
 
 import sublime
-import threading
 import re
+import traceback
 
 from .client import GerritClient
+from .executor import Executor, Promise, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
 from .reader import DataReader
 from .settings import Settings
 from .thread_progress import ThreadProgress
@@ -38,11 +39,29 @@ def urlencode(d):
 
     return '&'.join(s)
 
-class HttpThread(threading.Thread):
+class HttpRequest(Promise):
     API_VERSION = None
     SELF_DATA = None
+    executor = None
+
+    @classmethod
+    def get_executor(self):
+        max_workers = int(Settings.get('connection.max_workers') or 4)
+        max_background = int(Settings.get('connection.max_background_requests') or 1)
+
+        if HttpRequest.executor is None:
+            HttpRequest.executor = Executor(max_workers, max_background)
+        else:
+            HttpRequest.executor.configure(max_workers, max_background)
+
+        return HttpRequest.executor
 
     def __init__(self, kind, *request_args):
+        Promise.__init__(self)
+
+        self.started = False
+        self.running = False
+        self.priority = PRIORITY_INTERACTIVE
         self.request_args = request_args
         self.client = GerritClient({
             'username': Settings.get('connection.username'),
@@ -51,222 +70,323 @@ class HttpThread(threading.Thread):
             'timeout': Settings.get('connection.timeout')
         })
         self.reader = DataReader(kind)
-        self.callback = lambda data: None
 
-        threading.Thread.__init__(self)
+    def start(self):
+        if not self.started:
+            self.started = True
+            self.get_executor().submit(self.run, self.priority)
+
+        return self
+
+    def set_priority(self, priority):
+        raised = self.started and priority < self.priority
+        self.priority = priority
+
+        # queue it again with the higher priority, whichever copy runs first wins
+        if raised:
+            self.get_executor().submit(self.run, self.priority)
+
+        return self
+
+    def claim(self):
+        with self.lock:
+            if self.done or self.running:
+                return False
+
+            self.running = True
+
+        return True
 
     def run(self):
+        if not self.claim():
+            return
+
         ThreadProgress(self, 'Contacting Gerrit...')
+        self.guard(self.fetch)
 
+    def fetch(self):
         if self.check_version():
             self.get_self_data()
             print(self.request_args)
-            self.callback(self.reader.read(self.client.request(*self.request_args)))
+            self.resolve(self.reader.read(self.client.request(*self.request_args)))
+        else:
+            self.cancel()
+
+    # waiters must always be released, also when reading the response fails
+    def guard(self, fetch):
+        try:
+            fetch()
+        except Exception as e:
+            log('Request failed', self.request_args, e)
+            traceback.print_exc()
+            self.resolve(None)
+
+    def on_cancel(self):
+        self.client.abort()
+
+    def is_alive(self):
+        return self.started and not self.done
 
     def set_connection_settings(self, connection_settings):
         self.client.connection = connection_settings
 
     def then(self, callback):
-        self.callback = callback
+        chained = Promise.then(self, callback)
         self.start()
 
+        return chained
+
     def check_version(self):
-        if HttpThread.API_VERSION is None:
+        if HttpRequest.API_VERSION is None:
             version = self.client.request('GET', '/config/server/version', None, True)
-            HttpThread.API_VERSION = version
+            HttpRequest.API_VERSION = version
 
 
-        if HttpThread.API_VERSION and version_compare(HttpThread.API_VERSION, MIN_API_VERSION) < 0:
+        if HttpRequest.API_VERSION and version_compare(HttpRequest.API_VERSION, MIN_API_VERSION) < 0:
             error_message(
-                'Gerrit version %s detected, but at least %s is required. This version is not supported due to missing API features.' % (HttpThread.API_VERSION, MIN_API_VERSION)
+                'Gerrit version %s detected, but at least %s is required. This version is not supported due to missing API features.' % (HttpRequest.API_VERSION, MIN_API_VERSION)
             )
             return False
 
         return True
 
     def get_self_data(self):
-        if HttpThread.SELF_DATA is None:
-            HttpThread.SELF_DATA = DataReader(None).read(self.client.request('GET', '/accounts/self', None, True))
+        if HttpRequest.SELF_DATA is None:
+            HttpRequest.SELF_DATA = DataReader(None).read(self.client.request('GET', '/accounts/self', None, True))
 
 
-class SilentHttpThread(HttpThread):
+class SilentHttpRequest(HttpRequest):
     def run(self):
+        if not self.claim():
+            return
+
+        self.guard(self.fetch)
+
+    def fetch(self):
         self.get_self_data()
-        self.callback(self.reader.read(self.client.request(*self.request_args)))
+        self.resolve(self.reader.read(self.client.request(*self.request_args)))
 
 
 class GerritResources():
     self_data = None
 
+    def __init__(self):
+        self.requests = []
+
+    def track(self, request):
+        # only reads are cancelled with the owning view, writes must reach the server
+        if request.request_args[0] == 'GET':
+            self.requests = [r for r in self.requests if not r.is_done()]
+            self.requests.append(request)
+
+        return request
+
+    def cancel_all(self):
+        requests = self.requests
+        self.requests = []
+
+        for request in requests:
+            request.cancel()
+
     def test(self, connection_settings):
         connection_settings['timeout'] = 10
-        thread = self.changes(1, {'q': 'status:open'})
-        thread.set_connection_settings(connection_settings)
+        request = self.changes(1, {'q': 'status:open'})
+        request.set_connection_settings(connection_settings)
 
-        return thread
+        return request
 
     def changes(self, limit, query):
-        return HttpThread(
+        return self.track(HttpRequest(
             'gerritcodereview#change',
             'GET',
             '/changes/?O=1&n=%d&%s' % (limit, urlencode(query))
-        )
+        ))
 
     def get_self(self):
-        return HttpThread.SELF_DATA
+        return HttpRequest.SELF_DATA
 
     def check_changes(self, limit, query):
-        return SilentHttpThread(
+        return self.track(SilentHttpRequest(
             None,
             'GET',
             '/changes/?O=1&n=%d&%s' % (limit, urlencode(query)),
             None,
             True
-        )
-
-    def change(self, change_id):
-        opts = [
-            'DOWNLOAD_COMMANDS',
-            'ALL_REVISIONS',
-            'DETAILED_LABELS',
-            'CURRENT_ACTIONS',
-            'MESSAGES',
-            'DETAILED_ACCOUNTS',
-            'ALL_COMMITS',
-            'ALL_FILES',
-            'DRAFT_COMMENTS'
-        ]
-
-        return HttpThread(
+        )).set_priority(PRIORITY_BACKGROUND)
+
+    def change(self, change_id, full=None):
+        if full is None:
+            full = not Settings.get('change.lazy_detail')
+
+        if full:
+            opts = [
+                'DOWNLOAD_COMMANDS',
+                'ALL_REVISIONS',
+                'DETAILED_LABELS',
+                'CURRENT_ACTIONS',
+                'MESSAGES',
+                'DETAILED_ACCOUNTS',
+                'ALL_COMMITS',
+                'ALL_FILES',
+                'DRAFT_COMMENTS'
+            ]
+        else:
+            opts = [
+                'DOWNLOAD_COMMANDS',
+                'CURRENT_REVISION',
+                'DETAILED_LABELS',
+                'CURRENT_ACTIONS',
+                'MESSAGES',
+                'DETAILED_ACCOUNTS',
+                'CURRENT_COMMIT',
+                'CURRENT_FILES',
+                'DRAFT_COMMENTS'
+            ]
+
+        request = self.track(HttpRequest(
             'gerritcodereview#change',
             'GET',
             '/changes/%s/detail?o=%s' % (change_id, '&o='.join(opts))
-        )
+        ))
+
+        if full:
+            return request
+
+        def mark_partial(data):
+            if isinstance(data, list) and len(data) > 0:
+                data[0]['_partial_detail'] = True
+
+            return data
+
+        return request.then(mark_partial)
 
     def submit_type(self, change_id, revision_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'GET',
             '/changes/%s/revisions/%s/submit_type' % (change_id, revision_id)
-        )
+        ))
 
     def review(self, change_id, revision_id, review_data):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/revisions/%s/review' % (change_id, revision_id),
             review_data
-        )
+        ))
 
     def submit(self, change_id, revision_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/revisions/%s/submit' % (change_id, revision_id),
             {'wait_for_merge': True}
-        )
+        ))
 
     def rebase(self, change_id, revision_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/revisions/%s/rebase' % (change_id, revision_id)
-        )
+        ))
 
     def publish(self, change_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/publish' % (change_id)
-        )
+        ))
 
     def restore(self, change_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/restore' % (change_id)
-        )
+        ))
 
     def delete(self, change_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'DELETE',
             '/changes/%s' % (change_id)
-        )
+        ))
 
     def abandon(self, change_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/abandon' % (change_id)
-        )
+        ))
 
     def remove_reviewer(self, change_id, account_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'DELETE',
             '/changes/%s/reviewers/%s' % (change_id, account_id)
-        )
+        ))
 
     def suggest_reviewers(self, change_id, query='', limit=10):
-        return HttpThread(
+        return self.track(HttpRequest(
             'gerritcodereview#suggestedreviewer',
             'GET',
             '/changes/%s/suggest_reviewers?%s' % (change_id, urlencode({'q': query, 'n': limit}))
-        )
+        ))
 
     def add_reviewer(self, change_id, account_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/reviewers' % change_id,
             {'reviewer': account_id}
-        )
+        ))
 
-    def diff(self, change_id, revision_id, filename, base=None):
-        return HttpThread(
+    def diff(self, change_id, revision_id, filename, base=None, silent=False, context='ALL'):
+        return self.track(HttpRequest(
             None,
             'GET',
-            '/changes/%s/revisions/%s/files/%s/diff?intraline&context=ALL%s' % (
+            '/changes/%s/revisions/%s/files/%s/diff?intraline&context=%s%s' % (
                 change_id,
                 revision_id,
                 quote(filename, ''),
+                context,
                 ('&base=%d' % base) if base is not None else ''
-            )
-        )
+            ),
+            None,
+            silent
+        ))
 
     def get_content(self, change_id, revision_id, filename):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'GET',
             '/changes/%s/revisions/%s/files/%s/content' % (change_id, revision_id, quote(filename, '')),
             None,
             True
-        )
+        ))
 
     def set_reviewed(self, change_id, revision_id, filename):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'PUT',
             '/changes/%s/revisions/%s/files/%s/reviewed' % (change_id, revision_id, quote(filename, '')),
             None,
             True
-        )
+        )).set_priority(PRIORITY_BACKGROUND)
 
     def set_topic(self, change_id, topic):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'PUT',
             '/changes/%s/topic' % (change_id),
             {'topic': topic}
-        )
+        ))
 
     def delete_topic(self, change_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'DELETE',
             '/changes/%s/topic' % (change_id)
-        )
+        ))
 
     def create_draft_comment(self, change_id, revision_id, side, path, line, message, in_reply_to=None):
         data = {
@@ -279,12 +399,12 @@ class GerritResources():
         if in_reply_to is not None:
             data.update({'in_reply_to': in_reply_to})
 
-        return HttpThread(
+        return self.track(HttpRequest(
             'gerritcodereview#comment',
             'PUT',
             '/changes/%s/revisions/%s/drafts' % (change_id, revision_id),
             data
-        )
+        ))
 
     def update_draft_comment(self, change_id, revision_id, side, draft_id, path, line, message, in_reply_to=None):
         data = {
@@ -297,57 +417,57 @@ class GerritResources():
         if in_reply_to is not None:
             data.update({'in_reply_to': in_reply_to})
 
-        return HttpThread(
+        return self.track(HttpRequest(
             'gerritcodereview#comment',
             'PUT',
             '/changes/%s/revisions/%s/drafts/%s' % (change_id, revision_id, draft_id),
             data
-        )
+        ))
 
     def get_draft_comments(self, change_id, revision_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'GET',
             '/changes/%s/revisions/%s/drafts' % (change_id, revision_id),
             None,
             True
-        )
+        ))
 
     def delete_draft_comment(self, change_id, revision_id, draft_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'DELETE',
             '/changes/%s/revisions/%s/drafts/%s' % (change_id, revision_id, draft_id)
-        )
+        ))
 
     def get_comments(self, change_id, revision_id):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'GET',
             '/changes/%s/revisions/%s/comments' % (change_id, revision_id),
             None,
             True
-        )
+        ))
 
     def edit_commit_message(self, change_id, revision_id, message):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/revisions/%s/message' % (change_id, revision_id),
             {'message': message}
-        )
+        ))
 
     def project_branches(self, project):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'GET',
             '/projects/%s/branches' % (quote(project, ''))
-        )
+        ))
 
     def cherry_pick_to(self, change_id, revision_id, destination, message):
-        return HttpThread(
+        return self.track(HttpRequest(
             None,
             'POST',
             '/changes/%s/revisions/%s/cherrypick' % (change_id, revision_id),
             {'message': message, 'destination': destination}
-        )
+        ))
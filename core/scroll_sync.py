@@ -19,8 +19,14 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 """
 
 import sublime
+import time
 from math import ceil
 
+from .utils import log, is_debug
+
+MIN_INTERVAL = 5
+MAX_INTERVAL = 100
+
 class Scroller():
     def __init__(self, view, proportionally_x=False, proportionally_y=False):
         self.view = view
@@ -45,6 +51,7 @@ class Scroller():
         else:
             pos_x = max(0, min(pos[0], le[0] - ve[0]))
 
+        # both panes hold the same rows (changes are padded, folds are mirrored, word_wrap is off), so equal y is the same diff row
         if self.proportionally_y:
             percentage_y = min(1, pos[1] / (1 if le[1] <= ve[1] else le[1] - ve[1]))
             pos_y = max(0, min(ceil(percentage_y * (le[1] - ve[1])), le[1] - ve[1]))
@@ -86,15 +93,49 @@ class Scroller():
 
 class ScrollSync():
     def __init__(self, a, b):
-        self.interval = 1
+        self.interval = MIN_INTERVAL
 
         self.scrollers = [Scroller(a), Scroller(b)]
         self.scrollers_to_sync = []
         self.scroller_active = None
         self.enabled = True
+        self.running = False
+        self.generation = 0
         self.stored = None
+        self.stats = {'ticks': 0, 'busy': 0, 'started': time.time()}
+
+        self.kick()
+
+    # there is no scroll event, so polling resumes at full speed on any activity and slows down when idle
+    def kick(self):
+        if not self.enabled:
+            return
+
+        self.interval = MIN_INTERVAL
+        self.generation += 1
+        self.running = True
+
+        generation = self.generation
+        sublime.set_timeout(lambda: self.sync(generation), 0)
+
+    def pause(self):
+        if self.running:
+            self.running = False
+            self.log()
 
-        self.sync()
+    def log(self):
+        if not is_debug():
+            return
+
+        elapsed = max(time.time() - self.stats['started'], 0.001)
+
+        log('Scroll sync: %d ticks in %.1f s (%.1f/s), %d busy, interval %d ms' % (
+            self.stats['ticks'],
+            elapsed,
+            self.stats['ticks'] / elapsed,
+            self.stats['busy'],
+            self.interval
+        ))
 
     def store(self):
         self.stored = [scroller.view.viewport_position() for scroller in self.scrollers]
@@ -115,9 +156,16 @@ class ScrollSync():
         sublime.set_timeout(inner, 100)
 
     def destroy(self):
+        self.pause()
         self.enabled = False
 
-    def sync(self):
+    def sync(self, generation):
+        # a newer kick or a pause took over
+        if not self.enabled or not self.running or generation != self.generation:
+            return
+
+        self.stats['ticks'] += 1
+
         if not self.scroller_active:
             for scroller in self.scrollers:
                 if not scroller.is_synced():
@@ -137,5 +185,10 @@ class ScrollSync():
             self.scrollers_to_sync = []
             self.scroller_active = None
 
-        if self.enabled:
-            sublime.set_timeout(self.sync, self.interval)
+        if self.scroller_active:
+            self.stats['busy'] += 1
+            self.interval = MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * 2, MAX_INTERVAL)
+
+        sublime.set_timeout(lambda: self.sync(generation), self.interval)
@@ -0,0 +1,173 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+
+import sublime
+import os
+import re
+import json
+import plistlib
+import threading
+
+from .settings import Settings
+from .utils import log
+
+PLAIN_TEXT = 'Packages/Text/Plain text.tmLanguage'
+FILE_EXTENSIONS = re.compile(r'^file_extensions:[ \t]*\n((?:[ \t]+-.*\n?)+)', re.MULTILINE)
+LIST_ITEM = re.compile(r'^[ \t]+-[ \t]*[\'"]?([^\'"#\n]+?)[\'"]?[ \t]*(?:#.*)?$', re.MULTILINE)
+
+read_plist = getattr(plistlib, 'loads', None) or plistlib.readPlistFromBytes
+
+
+class SyntaxIndex():
+    index = None
+    built = None
+    resources = None
+    lock = threading.Lock()
+
+    @classmethod
+    def get_resources(self):
+        return sorted(sublime.find_resources('*.tmLanguage') + sublime.find_resources('*.sublime-syntax'))
+
+    @classmethod
+    def get_index_path(self):
+        return os.path.join(sublime.cache_path(), 'SublimeGerrit', 'syntax_index.json')
+
+    # runs off the UI thread, find() only reads what it leaves behind
+    @classmethod
+    def refresh(self):
+        resources = self.get_resources()
+        overrides = self.read_overrides(resources)
+
+        with self.lock:
+            # packages were added or removed since the index was built
+            if SyntaxIndex.built is None or SyntaxIndex.resources != resources:
+                built = self.load(resources)
+
+                if built is None:
+                    built = self.build(resources)
+                    self.save(resources, built)
+
+                SyntaxIndex.built = built
+                SyntaxIndex.resources = resources
+
+            # user settings are read on every refresh, so a changed mapping applies to the next diff
+            index = dict(SyntaxIndex.built)
+            index.update(overrides)
+
+            SyntaxIndex.index = index
+
+    # "extensions" in <Syntax>.sublime-settings, as written by "Open all with current extension as..."
+    @classmethod
+    def read_overrides(self, resources):
+        syntaxes = {}
+        overrides = {}
+
+        for resource in resources:
+            syntaxes.setdefault(os.path.splitext(os.path.basename(resource))[0], resource)
+
+        names = set(os.path.basename(resource) for resource in sublime.find_resources('*.sublime-settings'))
+
+        for name in sorted(names):
+            syntax = os.path.splitext(name)[0]
+
+            if syntax not in syntaxes:
+                continue
+
+            for extension in sublime.load_settings(name).get('extensions') or []:
+                overrides[extension.lower()] = syntaxes[syntax]
+
+        return overrides
+
+    @classmethod
+    def is_ready(self):
+        return SyntaxIndex.index is not None
+
+    @classmethod
+    def load(self, resources):
+        try:
+            with open(self.get_index_path(), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if stored.get('resources') != resources:
+            return None
+
+        return stored.get('index')
+
+    @classmethod
+    def save(self, resources, index):
+        path = self.get_index_path()
+
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'resources': resources, 'index': index}, f)
+        except (IOError, OSError) as e:
+            log('Could not save syntax index', e)
+
+    @classmethod
+    def build(self, resources):
+        index = {}
+
+        for resource in resources:
+            try:
+                extensions = self.read_extensions(resource)
+            except Exception as e:
+                log('Could not read syntax', resource, e)
+                continue
+
+            for extension in extensions:
+                index.setdefault(extension.lower(), resource)
+
+        return index
+
+    @classmethod
+    def read_extensions(self, resource):
+        if resource.endswith('.tmLanguage'):
+            return read_plist(sublime.load_binary_resource(resource)).get('fileTypes', [])
+
+        match = FILE_EXTENSIONS.search(sublime.load_resource(resource))
+
+        return LIST_ITEM.findall(match.group(1)) if match else []
+
+    @classmethod
+    def find(self, file_name):
+        name = os.path.basename(file_name)
+        fallbacks = Settings.get('diff.fallback_syntaxes') or {}
+        extension = os.path.splitext(name)[1].lower()
+
+        if extension in fallbacks:
+            return fallbacks[extension]
+
+        index = SyntaxIndex.index or {}
+        parts = name.lower().split('.')
+
+        # the whole name first (i.e. Makefile), then ever shorter suffixes (i.e. html.erb, erb)
+        for i in range(len(parts)):
+            suffix = '.'.join(parts[i:])
+
+            if suffix in index:
+                return index[suffix]
+
+        return PLAIN_TEXT
@@ -20,12 +20,15 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
 import sublime
 import os
-import tempfile
 import re
 
 import time
 import datetime
 import textwrap
+import threading
+import reprlib
+
+from collections import deque
 
 from urllib.parse import urlsplit
 
@@ -47,9 +50,89 @@ def version_compare(version1, version2):
 
     return cmp(normalize(version1), normalize(version2))
 
+LOG_BODY_LIMIT = 2000
+
+log_repr = reprlib.Repr()
+log_repr.maxlevel = 3
+log_repr.maxdict = 10
+log_repr.maxlist = 10
+log_repr.maxstring = 200
+log_repr.maxother = 200
+
+
+class Logger():
+    debug = None
+    log_file = None
+    lines = deque()
+    lock = threading.Lock()
+    flush_scheduled = False
+
+    @classmethod
+    def is_debug(self):
+        if Logger.debug is None:
+            Settings.un('debug')
+            Settings.on('debug', Logger.configure)
+            Logger.configure()
+
+        return Logger.debug
+
+    @classmethod
+    def configure(self):
+        Logger.log_file = Settings.get('debug.log_file') or None
+
+        with Logger.lock:
+            Logger.lines = deque(Logger.lines, int(Settings.get('debug.log_lines') or 10000))
+
+        Logger.debug = bool(Settings.get('debug'))
+
+    @classmethod
+    def write(self, *args):
+        line = ' '.join(str(arg) for arg in args)
+
+        if Logger.log_file is None:
+            print(line)
+            return
+
+        # printing to the console is slow, keep the latest lines and write them out in the background
+        with Logger.lock:
+            Logger.lines.append(line)
+            schedule = not Logger.flush_scheduled
+            Logger.flush_scheduled = True
+
+        if schedule:
+            sublime.set_timeout_async(Logger.flush, 1000)
+
+    @classmethod
+    def flush(self):
+        with Logger.lock:
+            lines = list(Logger.lines)
+            Logger.flush_scheduled = False
+
+        try:
+            with open(Logger.log_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+        except (IOError, OSError, TypeError) as e:
+            print('SublimeGerrit: could not write log file', e)
+
+
+def is_debug():
+    return Logger.is_debug()
+
 def log(*args):
-    if Settings.get('debug'):
-        print(*args)
+    if Logger.is_debug():
+        Logger.write(*args)
+
+def summarize(value):
+    if isinstance(value, bytes):
+        value = value[:LOG_BODY_LIMIT + 1].decode('utf-8', 'replace')
+
+    if isinstance(value, str):
+        if len(value) > LOG_BODY_LIMIT:
+            return value[:LOG_BODY_LIMIT] + '... (truncated)'
+
+        return value
+
+    return log_repr.repr(value)
 
 def fopen(path, mode):
     try:
@@ -82,14 +165,6 @@ def git_root(file_path=None):
 
     return down(file_path)
 
-def create_tmpfile_path(file_name):
-    f = tempfile.NamedTemporaryFile(suffix=os.path.basename(file_name))
-    path = f.name
-    f.close()
-
-    return path
-
-
 def get_reviewer_name(reviewer):
     if 'name' in reviewer and reviewer['name']:
         return reviewer['name']
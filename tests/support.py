@@ -0,0 +1,61 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+# Loads core modules outside of Sublime Text, the same way tools/ does.
+#
+#   python3 -m unittest discover tests
+
+import sys
+import os
+import json
+import types
+import importlib
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SublimeSettings(dict):
+    def set(self, key, value):
+        self[key] = value
+
+    def add_on_change(self, key, callback):
+        pass
+
+    def clear_on_change(self, key):
+        pass
+
+
+def load_core(name):
+    # outside of Sublime Text only the few calls made while importing are needed
+    if 'sublime' not in sys.modules:
+        sublime = types.ModuleType('sublime')
+        sublime.load_settings = lambda name: SublimeSettings()
+        sublime.platform = lambda: sys.platform
+        sublime.set_timeout = lambda callback, delay=0: None
+        sublime.set_timeout_async = lambda callback, delay=0: None
+        sublime.decode_value = json.loads
+        sys.modules['sublime'] = sublime
+
+    if 'SublimeGerrit' not in sys.modules:
+        spec = importlib.util.spec_from_file_location('SublimeGerrit', os.path.join(ROOT, 'core', '__init__.py'), submodule_search_locations=[ROOT])
+        sys.modules['SublimeGerrit'] = importlib.util.module_from_spec(spec)
+
+    return importlib.import_module('SublimeGerrit.core.' + name)
@@ -0,0 +1,112 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+import socket
+import threading
+import time
+import unittest
+import urllib.request
+
+from support import load_core
+
+client = load_core('client')
+
+
+# answers one request per connection, then closes it without telling the client
+class ClosingServer():
+    def __init__(self):
+        self.methods = []
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(10)
+        self.port = self.socket.getsockname()[1]
+
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, address = self.socket.accept()
+            except OSError:
+                return
+
+            threading.Thread(target=self.answer, args=(conn,), daemon=True).start()
+
+    def answer(self, conn):
+        data = conn.recv(65536)
+
+        if data:
+            self.methods.append(data.split(b' ')[0].decode())
+            conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+
+        time.sleep(0.05)
+        conn.close()
+
+    def close(self):
+        self.socket.close()
+
+
+class KeepAliveHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ClosingServer()
+        self.pool = client.ConnectionPool(4, 60)
+        self.opener = urllib.request.build_opener(client.KeepAliveHandler(self.pool))
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.close()
+
+    def open(self, method):
+        request = urllib.request.Request(
+            'http://127.0.0.1:%d/changes/' % self.server.port,
+            data=None if method == 'GET' else b'{}',
+            method=method
+        )
+
+        response = self.opener.open(request, timeout=5)
+        body = response.read()
+        response.close()
+
+        return body
+
+    def pool_stale_connection(self):
+        self.assertEqual(self.open('GET'), b'ok')
+
+        # let the server close the pooled connection
+        time.sleep(0.2)
+        self.assertEqual(sum(len(connections) for connections in self.pool.idle.values()), 1)
+
+    def test_get_retries_closed_connection(self):
+        self.pool_stale_connection()
+
+        self.assertEqual(self.open('GET'), b'ok')
+        self.assertEqual(self.server.methods, ['GET', 'GET'])
+
+    def test_post_after_server_closed_connection(self):
+        self.pool_stale_connection()
+
+        self.assertEqual(self.open('POST'), b'ok')
+        self.assertEqual(self.open('PUT'), b'ok')
+        self.assertEqual(self.open('DELETE'), b'ok')
+        self.assertEqual(self.server.methods, ['GET', 'POST', 'PUT', 'DELETE'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+import threading
+import time
+import unittest
+
+from support import load_core
+
+executor = load_core('executor')
+
+
+class ExecutorTest(unittest.TestCase):
+    def run_burst(self, pool, count, duration):
+        done = threading.Semaphore(0)
+
+        def task():
+            time.sleep(duration)
+            done.release()
+
+        started = time.time()
+
+        for i in range(count):
+            pool.submit(task)
+
+        for i in range(count):
+            self.assertTrue(done.acquire(timeout=10))
+
+        return time.time() - started
+
+    def test_burst_runs_in_parallel(self):
+        pool = executor.Executor(4)
+        self.run_burst(pool, 1, 0.05)
+
+        # the first worker is idle now and must not take the whole burst alone
+        self.assertLess(self.run_burst(pool, 4, 0.5), 1.0)
+        self.assertEqual(pool.workers, 4)
+
+    def test_workers_are_bounded(self):
+        pool = executor.Executor(2)
+
+        self.assertGreaterEqual(self.run_burst(pool, 4, 0.2), 0.4)
+        self.assertEqual(pool.workers, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+# Building and querying a line mapping the way DiffView fills it: one dict
+# entry per line versus LineMapping segments added per block.
+#
+#   python3 tools/bench_line_mapping.py [lines] [block_size]
+
+import sys
+import os
+import time
+import random
+import importlib.util
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_line_mapping():
+    spec = importlib.util.spec_from_file_location('line_mapping', os.path.join(ROOT, 'core', 'line_mapping.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module.LineMapping
+
+
+def build_dict(lines, block_size):
+    mapping = {}
+    missing = 0
+
+    for line in range(lines):
+        mapping.update({line + 1: line + missing})
+
+        # every block ends with a change padded by three missing lines
+        if line % block_size == block_size - 1:
+            missing += 3
+
+    return mapping
+
+
+def build_segments(LineMapping, lines, block_size):
+    mapping = LineMapping()
+    missing = 0
+
+    for begin in range(0, lines, block_size):
+        mapping.add(begin + 1, begin + missing, min(block_size, lines - begin))
+        missing += 3
+
+    return mapping
+
+
+def measure(name, build, queries):
+    tracemalloc.start()
+    mapping = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # timed without tracemalloc, which slows allocations down
+    started = time.time()
+    build()
+    built = time.time() - started
+
+    started = time.time()
+
+    for line in queries:
+        mapping[line]
+
+    queried = time.time() - started
+
+    print('%-12s build %7.1f ms  memory %8.1f KB  %d lookups %7.1f ms' % (
+        name,
+        built * 1000,
+        current / 1024,
+        len(queries),
+        queried * 1000
+    ))
+
+    return mapping
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    LineMapping = load_line_mapping()
+
+    random.seed(0)
+    queries = [random.randint(1, lines) for i in range(100000)]
+
+    print('%d lines in blocks of %d' % (lines, block_size))
+
+    expected = measure('dict', lambda: build_dict(lines, block_size), queries)
+    mapping = measure('LineMapping', lambda: build_segments(LineMapping, lines, block_size), queries)
+
+    if any(mapping[line] != expected[line] for line in expected):
+        print('LineMapping differs from dict')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+SublimeGerrit - full-featured Gerrit Code Review for Sublime Text
+
+Copyright (C) 2015 Borys Forytarz <borys.forytarz@gmail.com>
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+"""
+
+# Peak memory of reading a large diff response: whole body at once versus
+# the incremental read_text() used by the client.
+#
+#   python3 tools/bench_read_text.py [lines] [--gzip]
+
+import sys
+import io
+import os
+import gzip
+import json
+import types
+import importlib.util
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_client():
+    # outside of Sublime Text only the few calls made while importing are needed
+    if 'sublime' not in sys.modules:
+        sublime = types.ModuleType('sublime')
+        sublime.load_settings = lambda name: {}
+        sublime.platform = lambda: sys.platform
+        sublime.set_timeout = lambda callback, delay=0: None
+        sublime.set_timeout_async = lambda callback, delay=0: None
+        sublime.decode_value = json.loads
+        sys.modules['sublime'] = sublime
+
+    spec = importlib.util.spec_from_file_location('SublimeGerrit', os.path.join(ROOT, 'core', '__init__.py'), submodule_search_locations=[ROOT])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules['SublimeGerrit'] = package
+
+    return importlib.import_module('SublimeGerrit.core.client')
+
+
+class Response(io.BytesIO):
+    def __init__(self, body, encoding=None):
+        io.BytesIO.__init__(self, body)
+        self.headers = {'Content-Encoding': encoding} if encoding else {}
+
+    def info(self):
+        return self.headers
+
+
+def read_whole(response):
+    chunks = []
+
+    while True:
+        chunk = response.read(65536)
+
+        if not chunk:
+            break
+
+        chunks.append(chunk)
+
+    data = b''.join(chunks)
+
+    if response.info().get('Content-Encoding') == 'gzip':
+        data = gzip.decompress(data)
+
+    text = data.decode('utf-8')
+
+    return json.loads(text[text.index('\n') + 1:])
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    compress = '--gzip' in sys.argv
+    lines = int(args[0]) if args else 350000
+    client = load_client()
+
+    content = [{'ab': ['line %d of some code here' % i for i in range(100)]} for j in range(lines // 100)]
+    body = b")]}'\n" + json.dumps({'content': content}).encode('utf-8')
+
+    if compress:
+        body = gzip.compress(body)
+
+    print('body: %.2f MB%s' % (len(body) / 1e6, ' (gzip)' if compress else ''))
+
+    readers = [
+        ('whole body', read_whole),
+        ('read_text', lambda response: json.loads(client.read_text(response, True)))
+    ]
+
+    for name, reader in readers:
+        response = Response(body, 'gzip' if compress else None)
+
+        tracemalloc.start()
+        reader(response)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print('%-12s peak %.1f MB' % (name, peak / 1e6))
+
+
+if __name__ == '__main__':
+    main()